@@ -11,11 +11,34 @@ use with a Bus. Some use custom channels; see the documentation for each class.
 
 from magicbus.base import ChannelFailures
 
-try:
-    from magicbus.win32 import Win32Bus as Bus, Win32ProcessBus as ProcessBus
-except ImportError:
-    from magicbus.base import Bus
-    from magicbus.process import ProcessBus
-bus = ProcessBus()
-
 __all__ = ['ChannelFailures', 'Bus', 'ProcessBus', 'bus']
+
+
+def _load_buses():
+    """Return the (Bus, ProcessBus) classes for this platform."""
+    try:
+        from magicbus.win32 import Win32Bus as Bus, Win32ProcessBus as ProcessBus
+    except ImportError:
+        from magicbus.base import Bus
+        from magicbus.process import ProcessBus
+    return Bus, ProcessBus
+
+
+def __getattr__(name):
+    """Import the Bus classes, and create the global bus, on first use.
+
+    This keeps ``import magicbus`` cheap for code which only needs,
+    for example, :class:`ChannelFailures`.
+    """
+    if name in ('Bus', 'ProcessBus'):
+        value = dict(zip(('Bus', 'ProcessBus'), _load_buses()))[name]
+    elif name == 'bus':
+        value = __getattr__('ProcessBus')()
+    else:
+        raise AttributeError('module %r has no attribute %r' % (__name__, name))
+    # Cache it, so that __getattr__ is not called again for this name.
+    return globals().setdefault(name, value)
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
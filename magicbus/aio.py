@@ -0,0 +1,275 @@
+"""Asyncio implementations of the Bus and ProcessBus.
+
+An :class:`AsyncBus` works like a :class:`Bus <magicbus.base.Bus>`, except
+that ``publish`` and ``transition`` are coroutines which must be awaited
+from a running event loop. Listeners may be plain callables or coroutine
+functions (or any callable which returns an awaitable). Listeners which
+share a priority form a band: the awaitables returned by a band are run
+concurrently via :func:`asyncio.gather`, and each band finishes before the
+next one starts. Output is still returned in priority order, and failures
+are still collected into a single ``ChannelFailures`` exception, so the
+``errors`` map of the state machine applies just as it does for a Bus.
+
+The 'log' channel is the exception: ``log()`` remains a plain method so
+that it can be called from anywhere, which means 'log' listeners must be
+plain callables.
+
+Code which is not running in the event loop, such as other threads and
+signal handlers, must not call ``publish`` or ``transition`` directly,
+since nothing would await the result. Plugins instead use
+:meth:`AsyncBus.call_threadsafe`, which runs the call on the loop of the
+bus, and :meth:`AsyncBus.publish_sync` for listeners which must run in
+the publishing thread.
+"""
+
+import asyncio
+import inspect
+import sys
+import time
+import traceback as _traceback
+
+from magicbus import base
+from magicbus.process import ProcessBus
+
+
+class AsyncBus(base.Bus):
+    """State machine and pub/sub messenger for asyncio applications."""
+
+    loop = None
+    """The event loop which last awaited a transition (or publish)."""
+
+    async def transition(self, desired_state):
+        """Move to the desired state. Return output (list of lists)."""
+        self.loop = asyncio.get_running_loop()
+        output = []
+        transitions = self.transitions
+        path = transitions.path(self.state, desired_state)
+        i = 0
+        while i < len(path):
+            next_state = path[i]
+            output.append(await self._transition(next_state))
+            if self.state == next_state:
+                i += 1
+            else:
+                # A listener moved the bus elsewhere; continue from there.
+                path = transitions.path(self.state, desired_state)
+                i = 0
+        return output
+
+    async def _transition(self, newstate, *args, **kwargs):
+        """Transition and publish to the new state. Return output list.
+
+        See :meth:`Bus._transition <magicbus.base.Bus._transition>`.
+        """
+        hooks = self._hooks
+        if hooks:
+            state = self._before_transition(hooks, newstate)
+            started = time.perf_counter()
+        try:
+            self._enter_state(newstate)
+            output = await self.publish(newstate, *args, **kwargs)
+        except self.throws:
+            if hooks:
+                self._after_transition(hooks, state, newstate, started,
+                                       sys.exc_info()[1])
+            raise
+        except:
+            if hooks:
+                self._after_transition(hooks, state, newstate, started,
+                                       sys.exc_info()[1])
+            if newstate in self.errors:
+                await self._transition(self.errors[newstate], *sys.exc_info())
+            else:
+                raise
+        else:
+            if hooks:
+                self._after_transition(hooks, state, newstate, started, None)
+            return output
+
+    async def publish(self, channel, *args, **kwargs):
+        """Return output of all subscribers for the given channel."""
+        if self.loop is None:
+            self.loop = asyncio.get_running_loop()
+        if self._dead:
+            self._purge()
+        try:
+            bands = self._bands[channel]
+        except KeyError:
+            if not self._compile(channel):
+                return []
+            bands = self._bands[channel]
+
+        exc = None
+        output = []
+        for band in bands:
+            # A list of [listener, result, is_awaitable] entries
+            # for the listeners of this band which did not fail.
+            called = []
+            awaitables = []
+            for listener in band:
+                try:
+                    result = listener(*args, **kwargs)
+                except self.throws:
+                    raise
+                except:
+                    exc = self._listener_failed(exc, channel, listener)
+                    continue
+                pending = inspect.isawaitable(result)
+                if pending:
+                    awaitables.append(result)
+                called.append([listener, result, pending])
+
+            if awaitables:
+                results = iter(await asyncio.gather(
+                    *awaitables, return_exceptions=True))
+                for entry in called:
+                    if entry[2]:
+                        entry[1] = next(results)
+
+            for listener, result, pending in called:
+                if pending and isinstance(result, BaseException):
+                    try:
+                        raise result
+                    except self.throws:
+                        raise
+                    except:
+                        exc = self._listener_failed(exc, channel, listener)
+                else:
+                    output.append(result)
+
+        if exc:
+            raise exc
+        return output
+
+    def publish_sync(self, channel, *args, **kwargs):
+        """Publish to the given channel, running listeners in this thread.
+
+        Nothing is awaited, so the listeners must be plain callables;
+        TypeError is raised if any of them returns an awaitable.
+        """
+        output = base.Bus.publish(self, channel, *args, **kwargs)
+        pending = [result for result in output if inspect.isawaitable(result)]
+        if pending:
+            for result in pending:
+                if inspect.iscoroutine(result):
+                    # Avoid the 'never awaited' warning.
+                    result.close()
+            raise TypeError('publish_sync(%r) cannot await listener results; '
+                            'subscribe plain callables.' % (channel,))
+        return output
+
+    def call_threadsafe(self, func, *args, **kwargs):
+        """Run func(*args, **kwargs), awaiting its result, on self.loop.
+
+        This may be called from any thread, or from a signal handler; it
+        returns a :class:`concurrent.futures.Future` at once, without
+        waiting for the call to finish. RuntimeError is raised if the bus
+        has no running event loop yet.
+        """
+        loop = self.loop
+        if loop is None or loop.is_closed():
+            raise RuntimeError('%r has no event loop; await one of its '
+                               'transitions first.' % (self,))
+
+        async def call():
+            result = func(*args, **kwargs)
+            if inspect.isawaitable(result):
+                result = await result
+            return result
+
+        return asyncio.run_coroutine_threadsafe(call(), loop)
+
+    def wait(self, state, interval=0.1, channel=None, sleep=False,
+             timeout=None):
+        """Block until the bus enters the given state(s); see Bus.wait.
+
+        This must not be called from the event loop, which it would block;
+        await :meth:`wait_async` there instead. Publishing to the given
+        channel is done on the event loop, via :meth:`call_threadsafe`.
+        """
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            pass
+        else:
+            raise RuntimeError('AsyncBus.wait() would block the event loop; '
+                               'await wait_async() instead.')
+        return base.Bus.wait(self, state, interval, channel, sleep, timeout)
+
+    def log(self, msg='', level=20, traceback=False):
+        """Log the given message. Append the last traceback if requested."""
+        if traceback:
+            if traceback is True:
+                exc_info = sys.exc_info()
+            else:
+                exc_info = traceback
+            msg += '\n' + ''.join(_traceback.format_exception(*exc_info))
+        base.Bus.publish(self, 'log', msg, level)
+
+
+class AsyncProcessBus(AsyncBus, ProcessBus):
+    """A ProcessBus whose publish and transition methods are coroutines.
+
+    For example, to stop many connection pools at once::
+
+        bus = AsyncProcessBus()
+        for pool in pools:
+            bus.subscribe('STOP', pool.aclose)
+        await bus.transition('RUN')
+        ...
+        await bus.transition('EXITED')
+    """
+
+    async def START_ERROR(self, *exc_info):
+        self.log('Exiting due to error in start listener:',
+                 level=40, traceback=exc_info)
+        await self.transition('EXITED')
+
+    async def STOP_ERROR(self, *exc_info):
+        self.log('Exiting due to error in stop listener:',
+                 level=40, traceback=exc_info)
+        await self.transition('EXITED')
+
+    async def restart(self):
+        """Restart the process (may close connections).
+
+        See :meth:`ProcessBus.restart <magicbus.process.ProcessBus.restart>`.
+        """
+        from magicbus.plugins.lifecycle import Execv
+        Execv(self).subscribe()
+        await self.transition('EXITED')
+
+    async def graceful(self):
+        """Move to the IDLE state, then back to RUN."""
+        await self.transition('IDLE')
+        await self.transition('RUN')
+
+    async def start_with_callback(self, func, args=None, kwargs=None):
+        """Move to RUN, then schedule coroutine 'func' as a task; return it."""
+        if args is None:
+            args = ()
+        if kwargs is None:
+            kwargs = {}
+        await self.transition('RUN')
+        return asyncio.ensure_future(func(*args, **kwargs))
+
+    async def block(self, interval=0.1):
+        """Wait for the EXITED state, then publish to 'execv'.
+
+        Unlike :meth:`ProcessBus.block <magicbus.process.ProcessBus.block>`,
+        this yields to the event loop between checks of the bus state,
+        publishing to the 'main' channel each time.
+        """
+        try:
+            while self.state != 'EXITED':
+                await asyncio.sleep(interval)
+                await self.publish('main')
+        except KeyboardInterrupt:
+            self.log('Keyboard Interrupt: shutting down bus')
+            await self.transition('EXITED')
+        except SystemExit:
+            self.log('SystemExit raised: shutting down bus')
+            await self.transition('EXITED')
+            raise
+
+        await self.publish('execv')
@@ -10,21 +10,15 @@ messaging to accomplish all this. Frameworks and site containers
 are free to define their own channels. If a message is sent to a
 channel that has not been defined or has no listeners, there is no effect.
 """
-import errno
+import array
+import collections
+import functools
 import os
-import random
-try:
-    import select
-except ImportError:
-    select = None
-else:
-    try:
-        epoll = select.epoll
-    except AttributeError:
-        epoll = None
 import sys
+import threading
 import time
-import traceback as _traceback
+import types
+import weakref
 
 
 class ChannelFailures(Exception):
@@ -79,16 +73,81 @@ class Graph(dict):
     [Pa, ..., Pz] by iteratively calling self.get((Pn, Pz)).
 
     Any pair (A, B) not in the map has no path.
+
+    Graphs are read-only, since a single instance may be shared by many
+    buses. On first use, the map is compiled into integer state ids and
+    an array of next hops, from which whole paths are computed (and
+    cached) by :meth:`path`; the dict itself remains available as a view.
     """
 
-    @property
+    def _readonly(self, *args, **kwargs):
+        raise TypeError('Graph objects are read-only; build a new one.')
+
+    __setitem__ = __delitem__ = __ior__ = _readonly
+    clear = pop = popitem = setdefault = update = _readonly
+
+    def __reduce__(self):
+        return self.__class__, (dict(self),)
+
+    @functools.cached_property
     def states(self):
-        """The set of all states in the graph."""
+        """The (frozen) set of all states in the graph."""
         s = set(self.values())
         for a, b in self:
             s.add(a)
             s.add(b)
-        return s
+        return frozenset(s)
+
+    @functools.cached_property
+    def _table(self):
+        """Return ({state: id}, (state, ...), next-hop id array).
+
+        The array holds the id of the next state on the shortest path from
+        state i to state j at index i * len(states) + j, or -1 if there is
+        no path.
+        """
+        names = []
+        for (a, b), c in self.items():
+            names.extend((a, b, c))
+        names = tuple(dict.fromkeys(names))
+        ids = dict((name, i) for i, name in enumerate(names))
+        size = len(names)
+
+        hops = array.array('i', [-1]) * (size * size)
+        for (a, b), c in self.items():
+            hops[ids[a] * size + ids[b]] = ids[c]
+        return ids, names, hops
+
+    @functools.cached_property
+    def _paths(self):
+        """A cache of {(A, Z): (B, ..., Z)} for self.path."""
+        return {}
+
+    def path(self, start, end):
+        """Return the tuple of states after start on the shortest path to end.
+
+        The tuple is empty if start is end or if there is no such path.
+        """
+        key = (start, end)
+        try:
+            return self._paths[key]
+        except KeyError:
+            pass
+
+        ids, names, hops = self._table
+        size = len(names)
+        path = []
+        if start != end and start in ids and end in ids:
+            i, j = ids[start], ids[end]
+            while i != j and len(path) < size:
+                i = hops[i * size + j]
+                if i == -1:
+                    # A Graph built by hand may contain dead ends.
+                    break
+                path.append(names[i])
+        path = tuple(path)
+        self._paths[key] = path
+        return path
 
     @classmethod
     def from_edges(cls, edges):
@@ -100,63 +159,244 @@ class Graph(dict):
         from the key node to each node in the value. For example, the
         dict {"A": "B", "B", ("C", "D")} defines 3 edges: A to B,
         B to C and B to D.
+
+        Graphs are cached by their edges, so identical state machines
+        share a single (read-only) Graph instance.
         """
-        # Modified Floyd-Warshall algorithm, where all weights are 1.
+        if edges is None:
+            edges = {}
+        frozen = []
+        for k, v in edges.items():
+            if not isinstance(v, (list, tuple)):
+                v = (v,)
+            frozen.append((k, tuple(v)))
+        return cls._from_frozen_edges(tuple(frozen))
+
+    @classmethod
+    @functools.lru_cache(maxsize=256)
+    def _from_frozen_edges(cls, edges):
+        """Form a Graph from a ((from, (to1, to2)), ...) tuple of edges."""
+        # Breadth-first search from each node, since all weights are 1.
         # Rather than a sparse matrix, we build a map {(A, B): next}
         # where the "next" value is the next node on the shortest path
         # from A to B. Any pair (a, b) not in the map has no path.
         # Thereby, calling code can find the shortest path [Pn, Pn+1, ...]
         # by iteratively calling self.get((Pn, Pn+1), None)
-        if edges is None:
-            edges = {}
-        states = set()
+        # Where several shortest paths exist, the first declared edge wins.
+        adjacent = {}
+        for k, v in edges:
+            adjacent.setdefault(k, []).extend(v)
 
-        distances = {}
         next = {}
-        for k, v in edges.items():
-            states.add(k)
-            distances[(k, k)] = 0
-
-            if not isinstance(v, (list, tuple)):
-                v = (v,)
-            for s in v:
-                states.add(s)
-                # Store the edge from k to s.
-                distances[(k, s)] = 1
-                next[(k, s)] = s
-
-        for k in states:
-            for i in states:
-                for j in states:
-                    segment1 = distances.get((i, k))
-                    if segment1 is None:
-                        continue
-                    segment2 = distances.get((k, j))
-                    if segment2 is None:
-                        continue
-                    candidate_distance = segment1 + segment2
-
-                    curpair = (i, j)
-                    current_distance = distances.get(curpair)
-                    if current_distance is None or current_distance > candidate_distance:
-                        # print ("(%s -> %s) %s > (%s -> %s -> %s) %s" %
-                        #        (i, j, current_distance,
-                        #         i, k, j, candidate_distance))
-                        distances[curpair] = candidate_distance
-                        next[curpair] = next.get((i, k), k)
+        for source, targets in adjacent.items():
+            # A map of {reached node: first hop from source toward it}.
+            hops = {}
+            for s in targets:
+                # Store the edge from source to s.
+                hops.setdefault(s, s)
+            queue = collections.deque(hops)
+            while queue:
+                node = queue.popleft()
+                hop = hops[node]
+                for s in adjacent.get(node, ()):
+                    if s not in hops and s != source:
+                        hops[s] = hop
+                        queue.append(s)
+            for target, hop in hops.items():
+                next[(source, target)] = hop
 
         return cls(next)
 
 
+class TopicTrie:
+    """A trie of dotted channel patterns, matched against concrete channels.
+
+    Channels are split into segments on '.'. In a pattern, a '*' segment
+    matches exactly one segment, and a '#' segment matches zero or more
+    segments. For example, 'cache.invalidate.*' matches the channel
+    'cache.invalidate.users', and 'cache.#' matches both 'cache' and
+    'cache.invalidate.users'.
+    """
+
+    def __init__(self):
+        self.root = _TopicNode()
+        self.patterns = set()
+
+    def __len__(self):
+        return len(self.patterns)
+
+    @staticmethod
+    def is_pattern(channel):
+        """Return True if the given channel contains wildcard segments."""
+        if not isinstance(channel, str):
+            return False
+        if '*' not in channel and '#' not in channel:
+            return False
+        return any(
+            segment in ('*', '#') for segment in channel.split('.'))
+
+    def add(self, pattern):
+        """Add the given pattern (if not present)."""
+        node = self.root
+        for segment in pattern.split('.'):
+            node = node.children.setdefault(segment, _TopicNode())
+        node.patterns.add(pattern)
+        self.patterns.add(pattern)
+
+    def discard(self, pattern):
+        """Remove the given pattern (if present)."""
+        if pattern not in self.patterns:
+            return
+        self.patterns.discard(pattern)
+
+        path = [self.root]
+        segments = pattern.split('.')
+        for segment in segments:
+            path.append(path[-1].children[segment])
+        path[-1].patterns.discard(pattern)
+        # Prune nodes which no longer lead to any pattern.
+        for segment, parent, node in reversed(
+                list(zip(segments, path, path[1:]))):
+            if node.patterns or node.children:
+                break
+            del parent.children[segment]
+
+    def match(self, channel):
+        """Return the set of patterns which match the given channel."""
+        matches = set()
+        if self.patterns:
+            self.root.match(channel.split('.'), 0, matches)
+        return matches
+
+
+class _TopicNode:
+    """A node in a TopicTrie."""
+
+    __slots__ = ('children', 'patterns')
+
+    def __init__(self):
+        self.children = {}
+        self.patterns = set()
+
+    def match(self, segments, i, matches):
+        """Add patterns under self which match segments[i:] to matches."""
+        children = self.children
+        if i == len(segments):
+            matches.update(self.patterns)
+        else:
+            child = children.get(segments[i])
+            if child is not None:
+                child.match(segments, i + 1, matches)
+            child = children.get('*')
+            if child is not None:
+                child.match(segments, i + 1, matches)
+        child = children.get('#')
+        if child is not None:
+            for j in range(i, len(segments) + 1):
+                child.match(segments, j, matches)
+
+
+class WeakListener:
+    """A callable which weakly references a listener (see Bus.subscribe).
+
+    Bound methods are referenced via :class:`weakref.WeakMethod`, so that
+    subscribing a method does not keep its object alive. A WeakListener
+    compares equal to (and hashes like) the listener it references, so
+    the listener itself may be passed to Bus.unsubscribe. Once the
+    listener is garbage-collected, callback(self) is called.
+    """
+
+    __slots__ = ('ref', 'hash', '__weakref__')
+
+    def __init__(self, listener, callback=None):
+        if callback is None:
+            expired = None
+        else:
+            def expired(ref, self_ref=weakref.ref(self)):
+                wrapper = self_ref()
+                if wrapper is not None:
+                    callback(wrapper)
+        if isinstance(listener, types.MethodType):
+            self.ref = weakref.WeakMethod(listener, expired)
+        else:
+            self.ref = weakref.ref(listener, expired)
+        self.hash = hash(listener)
+
+    def __call__(self, *args, **kwargs):
+        listener = self.ref()
+        if listener is None:
+            # Collected, but not yet reaped.
+            return None
+        return listener(*args, **kwargs)
+
+    def __hash__(self):
+        return self.hash
+
+    def __eq__(self, other):
+        if isinstance(other, WeakListener):
+            return self.ref == other.ref
+        listener = self.ref()
+        return listener is not None and listener == other
+
+    def __repr__(self):
+        return 'WeakListener(%r)' % (self.ref(),)
+
+
+class BusHook:
+    """Base class for objects which observe a Bus (see Bus.add_hook).
+
+    Each method is called synchronously by the bus; override the ones you
+    need. Durations are in seconds, and exc is the exception raised (or
+    None). An exception raised by a hook is treated like an exception
+    raised by the listener (or state) being observed.
+
+    Per-listener methods are called by Bus.publish, including from
+    executor threads; AsyncBus only calls the transition methods.
+    """
+
+    def before_publish(self, channel, listener):
+        """Called before listener is called for a message on channel."""
+
+    def after_publish(self, channel, listener, duration, exc):
+        """Called after listener has handled a message on channel."""
+
+    def before_transition(self, state, newstate):
+        """Called before the bus moves from state to newstate."""
+
+    def after_transition(self, state, newstate, duration, exc):
+        """Called after the listeners of newstate have run."""
+
+
 class Bus:
     """State machine and pub/sub messenger.
 
-    If the 'select' module is present (POSIX systems), then select.select()
-    (on an os.pipe) will be used in self.wait instead of time.sleep().
+    Threads which call self.wait() register in a single registry keyed by
+    the states they wait for, and are woken only when one of those states
+    is entered.
     """
 
     publish_exception_class = ChannelFailures
 
+    throws = ()
+    """Exception classes which publish() re-raises instead of collecting."""
+
+    reaped = 0
+    """The number of weak subscriptions removed since their callee died."""
+
+    max_matched_channels = 1024
+    """How many channels with no listeners of their own are compiled at once.
+
+    Such channels are only compiled because they match a wildcard
+    pattern; the least recently compiled ones are evicted beyond this
+    limit, so that publishing to ever-new channels cannot grow the cache.
+    """
+
+    dispatcher = None
+    """The :class:`Dispatcher <magicbus.plugins.tasks.Dispatcher>` for post().
+
+    A Dispatcher sets this attribute when subscribed.
+    """
+
     def __init__(self, transitions=None, errors=None,
                  initial_state=None, extra_channels=None, id=None):
         if not isinstance(transitions, Graph):
@@ -172,24 +412,122 @@ class Bus:
             self.listeners[c] = set()
 
         if id is None:
-            id = hex(random.randint(0, sys.maxsize))[-8:]
+            id = os.urandom(4).hex()
         self.id = id
         self._priorities = {}
-        self._state_transition_pipes = set()
+        # (channel, WeakListener) pairs whose listener has been collected,
+        # queued by _reap and removed by _purge.
+        self._dead = collections.deque()
+        # A map of {channel: (listener, ...)} in priority order, compiled
+        # by subscribe/unsubscribe/clear so that publish need not sort.
+        self._dispatch = {}
+        # The same listeners grouped into ((listener, ...), ...) bands
+        # of equal priority, for publishers which run a band at once.
+        self._bands = {}
+        # Wildcard channels; see TopicTrie. Their listeners are merged into
+        # the compiled dispatch of each concrete channel they match.
+        self._topics = TopicTrie()
+        # The channels compiled only because they match a pattern, least
+        # recently compiled first; see max_matched_channels.
+        self._matched = collections.OrderedDict()
+        # Marks threads which are running a band for self.executor.
+        self._band_worker = threading.local()
+        # The threads which have run a band, for ThreadWait to skip.
+        self._executor_threads = weakref.WeakSet()
+        self._executor = None
+        self._listener_stats = None
+        self._hooks = ()
+        # True if publish must take the slow path for any of the above.
+        self._intercepted = False
+        # A map of {state: set of callback(state)} for self.wait() and
+        # friends, guarded by a lock so no state entry can be missed.
+        # The lock is reentrant because signal handlers make transitions
+        # on the main thread, which may hold it inside wait().
+        self._state_lock = threading.RLock()
+        self._state_waiters = {}
 
     @property
     def states(self):
         return self.transitions.states
 
+    @property
+    def executor(self):
+        """An optional :class:`concurrent.futures.Executor` for publish().
+
+        If None (the default), listeners run one after another in the
+        publishing thread. Otherwise, listeners which share a priority on
+        any channel but 'log' are submitted to the executor together, and
+        each such band finishes before the next one starts. Results are
+        still returned in priority order. For example, to start servers
+        at once::
+
+            bus.executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=8)
+
+        The bus does not shut the executor down, and a ProcessBus does not
+        wait for the threads which have run its listeners when it exits. A
+        listener which publishes from inside the executor runs that publish
+        serially, so a bounded pool cannot deadlock waiting on itself.
+        """
+        return self._executor
+
+    @executor.setter
+    def executor(self, value):
+        self._executor = value
+        self._update_intercepted()
+
+    @property
+    def listener_stats(self):
+        """A :class:`ListenerStats <magicbus.stats.ListenerStats>`, or None.
+
+        If set, publish() records the wall and CPU time of each listener
+        call in it. See stats().
+        """
+        return self._listener_stats
+
+    @listener_stats.setter
+    def listener_stats(self, value):
+        self._listener_stats = value
+        self._update_intercepted()
+
+    def add_hook(self, hook):
+        """Start calling the given :class:`BusHook` on publish and transition.
+
+        Without any hooks (or executor, or listener stats), publish pays
+        only a single attribute test for this facility.
+        """
+        if hook not in self._hooks:
+            self._hooks += (hook,)
+        self._update_intercepted()
+
+    def remove_hook(self, hook):
+        """Stop calling the given :class:`BusHook` (if added)."""
+        self._hooks = tuple([h for h in self._hooks if h is not hook])
+        self._update_intercepted()
+
+    def _update_intercepted(self):
+        self._intercepted = bool(
+            self._executor is not None or
+            self._listener_stats is not None or
+            self._hooks
+        )
+
     def transition(self, desired_state):
         """Move to the desired state. Return output (list of lists)."""
         output = []
-        while self.state != desired_state:
-            next_state = self.transitions.get((self.state, desired_state))
-            if next_state is None:
-                # Cannot proceed any further.
-                break
+        transitions = self.transitions
+        path = transitions.path(self.state, desired_state)
+        i = 0
+        while i < len(path):
+            next_state = path[i]
             output.append(self._transition(next_state))
+            if self.state == next_state:
+                i += 1
+            else:
+                # A listener moved the bus elsewhere (an error state,
+                # for example); continue from there.
+                path = transitions.path(self.state, desired_state)
+                i = 0
         return output
 
     def _transition(self, newstate, *args, **kwargs):
@@ -202,42 +540,22 @@ class Bus:
         Error transitions, for example, pass *sys.exc_info() as
         positional arguments to all error listeners.
         """
+        hooks = self._hooks
+        if hooks:
+            state = self._before_transition(hooks, newstate)
+            started = time.perf_counter()
         try:
-            self.state = newstate
-
-            # Write to any pipes created by threads calling self.wait().
-            # Use list() to avoid "Set changed size during iteration" errors.
-            for read_fd, write_fd in list(self._state_transition_pipes):
-                try:
-                    os.write(write_fd, b'1')
-                except OSError as os_err_exc:
-                    # Ref: https://github.com/cherrypy/magicbus/issues/16
-                    #
-                    # NOTE: This is supposedly happening when `self.wait()`
-                    # NOTE: closes the pipe on disposal.
-                    if os_err_exc.errno not in {
-                        # NOTE: This has been noticed in CI under both
-                        # NOTE: Ubuntu and Windows:
-                        errno.EBADF,
-
-                        # NOTE: This behavior is currently only observed
-                        # NOTE: under Windows in GHA CI/CD workflows:
-                        errno.EINVAL,
-                    }:
-                        raise
-
-            # Note: logging here means 1) the initial transition
-            # will not be logged if loggers are set up in the initial
-            # transition! and 2) the final transition will not be logged
-            # if loggers are torn down in the penultimate transition!
-            # This is why, for example, the included loggers are
-            # "always on" rather than listening for start/stop themselves.
-            self.log('Bus state: %s' % newstate)
-
-            return self.publish(newstate, *args, **kwargs)
+            self._enter_state(newstate)
+            output = self.publish(newstate, *args, **kwargs)
         except self.throws:
+            if hooks:
+                self._after_transition(hooks, state, newstate, started,
+                                       sys.exc_info()[1])
             raise
         except:
+            if hooks:
+                self._after_transition(hooks, state, newstate, started,
+                                       sys.exc_info()[1])
             if newstate in self.errors:
                 # Note we are calling the private method here;
                 # we do not allow a multi-hop transition to an error
@@ -245,16 +563,100 @@ class Bus:
                 self._transition(self.errors[newstate], *sys.exc_info())
             else:
                 raise
+        else:
+            if hooks:
+                self._after_transition(hooks, state, newstate, started, None)
+            return output
 
-    def subscribe(self, channel, callee, priority=None):
-        """Add the given callee at the given channel (if not present)."""
-        if channel not in self.listeners:
-            self.listeners[channel] = set()
-        self.listeners[channel].add(callee)
+    def _before_transition(self, hooks, newstate):
+        """Call before_transition on the given hooks; return the state."""
+        state = self.state
+        for hook in hooks:
+            hook.before_transition(state, newstate)
+        return state
+
+    def _after_transition(self, hooks, state, newstate, started, exc):
+        """Call after_transition on the given hooks."""
+        duration = time.perf_counter() - started
+        for hook in hooks:
+            hook.after_transition(state, newstate, duration, exc)
 
+    def _enter_state(self, newstate):
+        """Set self.state to newstate, wake waiting threads and log it."""
+        with self._state_lock:
+            self.state = newstate
+            waiters = self._state_waiters.pop(newstate, None)
+        if waiters:
+            for callback in waiters:
+                callback(newstate)
+
+        # Note: logging here means 1) the initial transition
+        # will not be logged if loggers are set up in the initial
+        # transition! and 2) the final transition will not be logged
+        # if loggers are torn down in the penultimate transition!
+        # This is why, for example, the included loggers are
+        # "always on" rather than listening for start/stop themselves.
+        self.log('Bus state: %s' % newstate)
+
+    def subscribe(self, channel, callee, priority=None, weak=False):
+        """Add the given callee at the given channel (if not present).
+
+        The channel may be a dotted pattern with '*' and '#' wildcard
+        segments (see :class:`TopicTrie`), in which case the callee will
+        receive messages published to every channel which matches it.
+
+        If weak is True, the bus only keeps a weak reference to the callee
+        (see :class:`WeakListener`), and unsubscribes it automatically
+        once it is garbage-collected.
+        """
+        if self._dead:
+            self._purge()
         if priority is None:
             priority = getattr(callee, 'priority', 50)
-        self._priorities[(channel, callee)] = priority
+        # Keep a strong reference to the callee until it is registered,
+        # so that it cannot be reaped before it is subscribed.
+        listener = callee
+        if weak:
+            listener = WeakListener(
+                callee, functools.partial(self._reap, channel))
+
+        if channel not in self.listeners:
+            self.listeners[channel] = set()
+        listeners = self.listeners[channel]
+        # Replace any existing (weak or strong) subscription of the callee.
+        listeners.discard(listener)
+        listeners.add(listener)
+        self._priorities.pop((channel, listener), None)
+        self._priorities[(channel, listener)] = priority
+        self._recompile(channel)
+
+    def _reap(self, channel, callee):
+        """Queue a WeakListener whose listener has been collected.
+
+        This is called by the garbage collector, which may run at any
+        allocation (in the middle of _compile, for example), so the
+        listener is only unsubscribed by the next _purge.
+        """
+        self._dead.append((channel, callee))
+
+    def _purge(self):
+        """Unsubscribe the WeakListeners queued by _reap."""
+        dead = self._dead
+        while dead:
+            try:
+                channel, callee = dead.popleft()
+            except IndexError:
+                # Purged by another thread meanwhile.
+                break
+            listeners = self.listeners.get(channel)
+            if listeners is not None:
+                for listener in list(listeners):
+                    if listener is callee:
+                        listeners.discard(listener)
+                        del self._priorities[(channel, listener)]
+                        self.reaped += 1
+                        self._recompile(channel)
+                        break
 
     def unsubscribe(self, channel, callee):
         """Discard the given callee (if present)."""
@@ -262,6 +664,7 @@ class Bus:
         if listeners and callee in listeners:
             listeners.discard(callee)
             del self._priorities[(channel, callee)]
+            self._recompile(channel)
 
     def clear(self):
         """Discard all subscribed callees."""
@@ -272,19 +675,108 @@ class Bus:
             for callee in list(listeners):
                 listeners.discard(callee)
                 del self._priorities[(channel, callee)]
+        self._topics = TopicTrie()
+        self._dispatch.clear()
+        self._bands.clear()
+        self._matched.clear()
 
-    def publish(self, channel, *args, **kwargs):
-        """Return output of all subscribers for the given channel."""
-        if channel not in self.listeners:
-            return []
+    def _recompile(self, channel):
+        """Update compiled dispatch after the listeners of channel changed."""
+        if self._topics.is_pattern(channel):
+            if self.listeners[channel]:
+                self._topics.add(channel)
+            else:
+                self._topics.discard(channel)
+            # Any concrete channel might match; recompile them lazily.
+            self._dispatch.clear()
+            self._bands.clear()
+            self._matched.clear()
+        else:
+            self._compile(channel)
 
-        exc = self.publish_exception_class()
-        output = []
+    def _compile(self, channel):
+        """Rebuild and return the priority-ordered listeners for channel.
 
-        items = [(self._priorities[(channel, listener)], listener)
-                 for listener in self.listeners[channel]]
+        Channels with neither listeners nor matching patterns are not
+        cached, so that publishing to arbitrary channels cannot grow the
+        cache; an empty tuple is returned for them. At most
+        max_matched_channels channels which only match patterns are cached.
+        """
+        if self._dead:
+            self._purge()
+        priorities = self._priorities
+        # Iterate over copies of the listener sets, since other threads
+        # may subscribe and unsubscribe meanwhile.
+        items = [(priorities[(channel, listener)], listener)
+                 for listener in tuple(self.listeners.get(channel, ()))]
+        if self._topics and isinstance(channel, str):
+            for pattern in self._topics.match(channel):
+                if pattern != channel:
+                    items.extend([(priorities[(pattern, listener)], listener)
+                                  for listener in tuple(self.listeners[pattern])])
+        if not items and channel not in self.listeners:
+            return ()
         items.sort(key=lambda item: item[0])
+
+        dispatch = []
+        seen = set()
+        bands = []
+        last = None
         for priority, listener in items:
+            if listener in seen:
+                # Subscribed to several matching channels; run it once.
+                continue
+            seen.add(listener)
+            dispatch.append(listener)
+            if not bands or priority != last:
+                bands.append([])
+                last = priority
+            bands[-1].append(listener)
+
+        dispatch = tuple(dispatch)
+        self._bands[channel] = tuple([tuple(band) for band in bands])
+        self._dispatch[channel] = dispatch
+        if channel in self.listeners:
+            self._matched.pop(channel, None)
+        else:
+            self._evict_matched(channel)
+        return dispatch
+
+    def _evict_matched(self, channel):
+        """Note that channel was compiled, evicting the oldest if too many."""
+        matched = self._matched
+        matched.pop(channel, None)
+        matched[channel] = None
+        while len(matched) > self.max_matched_channels:
+            try:
+                # Atomic, unlike iterating, if other threads compile too.
+                oldest = matched.popitem(last=False)[0]
+            except KeyError:
+                break
+            self._dispatch.pop(oldest, None)
+            self._bands.pop(oldest, None)
+
+    def publish(self, channel, *args, **kwargs):
+        """Return output of all subscribers for the given channel."""
+        if self._dead:
+            self._purge()
+        try:
+            dispatch = self._dispatch[channel]
+        except KeyError:
+            # Not compiled since the last change to wildcard channels,
+            # or added directly to self.listeners, or unknown.
+            dispatch = self._compile(channel)
+            if not dispatch:
+                return []
+
+        if self._intercepted:
+            return self._publish_intercepted(channel, dispatch, args, kwargs)
+
+        # The exception instance is only created once a listener fails,
+        # so the common (error-free) path allocates nothing but output.
+        exc = None
+        output = []
+        for listener in dispatch:
             try:
                 # Listeners are guaranteed to run even if others on the
                 # the same channel fail. We will still log the failure,
@@ -292,8 +784,7 @@ class Bus:
                 # to stop all processing from inside a listener is
                 # to raise one of the exceptions in self.throws
                 # (e.g. SystemExit).
-                result = listener(*args, **kwargs)
-                output.append(result)
+                output.append(listener(*args, **kwargs))
             except self.throws:
                 # e = sys.exc_info()[1]
                 # # If we have previous errors ensure the exit code is non-zero
@@ -301,87 +792,340 @@ class Bus:
                 #     e.code = 1
                 raise
             except:
-                exc.handle_exception()
+                exc = self._listener_failed(exc, channel, listener)
+        if exc:
+            raise exc
+        return output
 
-                if channel == 'log':
-                    # Assume any further messages to 'log' will fail.
-                    pass
-                else:
-                    self.log('Error in %r listener %r' % (channel, listener),
-                             level=40, traceback=True)
+    def publish_sync(self, channel, *args, **kwargs):
+        """Publish to the given channel, running listeners in this thread.
+
+        For a Bus, this is the same as publish(). Plugins whose listeners
+        must run in the publishing thread (such as those of ThreadManager)
+        use it so that they also work with an AsyncBus.
+        """
+        return self.publish(channel, *args, **kwargs)
+
+    def call_threadsafe(self, func, *args, **kwargs):
+        """Call func(*args, **kwargs), a method of this bus, from any thread.
+
+        For a Bus, this simply returns the result of the call. Plugins use
+        it to transition or publish from threads or signal handlers, so
+        that they also work with an AsyncBus (which runs the call on its
+        event loop instead).
+        """
+        return func(*args, **kwargs)
+
+    def post(self, channel, *args, **kwargs):
+        """Publish to the given channel later, without waiting for listeners.
+
+        The event is handed to self.dispatcher, whose own threads publish
+        it; output and listener errors are discarded (errors are logged by
+        publish, as usual). Return True if the event was queued, or False
+        if the dispatcher dropped it because its queue was full.
+
+        If no dispatcher is subscribed, the event is published at once (by
+        an AsyncBus, it is scheduled on its event loop instead).
+        """
+        return self.post_keyed(None, channel, *args, **kwargs)
+
+    def post_keyed(self, key, channel, *args, **kwargs):
+        """Post to the given channel, in order with events of the same key.
+
+        Events posted with equal (hashable) keys are published in the
+        order they were posted, even if the dispatcher publishes events
+        from several threads. See :meth:`post`.
+        """
+        dispatcher = self.dispatcher
+        if dispatcher is None:
+            try:
+                self.call_threadsafe(self.publish, channel, *args, **kwargs)
+            except self.publish_exception_class:
+                # Already logged by publish.
+                pass
+            return True
+        return dispatcher.put(channel, args, kwargs, key)
+
+    def _publish_intercepted(self, channel, dispatch, args, kwargs):
+        """Publish via self.executor, or with listener stats and hooks."""
+        if self._executor is not None and channel != 'log':
+            if not getattr(self._band_worker, 'active', False):
+                return self._publish_bands(channel, args, kwargs)
+        if not self._hooks and self._listener_stats is not None:
+            return self._publish_timed(channel, dispatch, args, kwargs)
+
+        exc = None
+        output = []
+        for listener in dispatch:
+            try:
+                output.append(
+                    self._call_intercepted(channel, listener, args, kwargs))
+            except self.throws:
+                raise
+            except:
+                exc = self._listener_failed(exc, channel, listener)
         if exc:
             raise exc
         return output
 
-    def wait(self, state, interval=0.1, channel=None, sleep=False):
-        """Poll for the given state(s) at intervals; publish to channel.
-
-        If sleep is True, the calling thread loops, sleeping for the given
-        interval each time, then returning only when the bus state is
-        one of the given states to wait for.
-
-        If sleep is False (the default) and the operating system supports
-        I/O multiplexing via the 'select' module, then an anonymous pipe
-        will be used to signal the waiting thread to wake up whenever
-        the state transitions. This allows the waiting thread to return
-        when the bus shuts down, for example, rather than waiting for
-        the sleep interval to elapse first. Each thread that calls wait()
-        creates a new pipe, so if file descriptors are in short supply
-        on your system you might need to use sleep instead.
+    def _publish_timed(self, channel, dispatch, args, kwargs):
+        """Publish, recording each listener call in self.listener_stats.
+
+        The clocks are read once between listeners: each reading ends the
+        timing of one listener and starts that of the next, which therefore
+        includes the recording of the one before.
+        """
+        record = self._listener_stats.record
+        wall_clock = time.perf_counter_ns
+        cpu_clock = time.thread_time_ns
+        exc = None
+        output = []
+        wall = wall_clock()
+        cpu = cpu_clock()
+        for listener in dispatch:
+            try:
+                output.append(listener(*args, **kwargs))
+            except self.throws:
+                record(channel, listener, wall_clock() - wall,
+                       cpu_clock() - cpu)
+                raise
+            except:
+                record(channel, listener, wall_clock() - wall,
+                       cpu_clock() - cpu)
+                exc = self._listener_failed(exc, channel, listener)
+                # Don't count logging the failure against the next one.
+                wall = wall_clock()
+                cpu = cpu_clock()
+                continue
+            end_wall = wall_clock()
+            end_cpu = cpu_clock()
+            record(channel, listener, end_wall - wall, end_cpu - cpu)
+            wall = end_wall
+            cpu = end_cpu
+        if exc:
+            raise exc
+        return output
+
+    def _call_intercepted(self, channel, listener, args, kwargs):
+        """Call listener, reporting to self.listener_stats and hooks."""
+        hooks = self._hooks
+        for hook in hooks:
+            hook.before_publish(channel, listener)
+
+        wall = time.perf_counter_ns()
+        cpu = time.thread_time_ns()
+        exc = None
+        try:
+            return listener(*args, **kwargs)
+        except BaseException as e:
+            exc = e
+            raise
+        finally:
+            wall = time.perf_counter_ns() - wall
+            stats = self._listener_stats
+            if stats is not None:
+                stats.record(channel, listener, wall,
+                             time.thread_time_ns() - cpu)
+            for hook in hooks:
+                hook.after_publish(channel, listener, wall / 1e9, exc)
+
+    def _publish_bands(self, channel, args, kwargs):
+        """Publish to channel, running each priority band on self.executor."""
+        bands = self._bands.get(channel)
+        if bands is None:
+            self._compile(channel)
+            bands = self._bands.get(channel, ())
+
+        exc = None
+        output = []
+        for band in bands:
+            if len(band) == 1:
+                calls = [(band[0], None)]
+            else:
+                calls = [
+                    (listener, self._executor.submit(
+                        self._run_band_listener,
+                        channel, listener, args, kwargs))
+                    for listener in band
+                ]
+            # Collecting every result makes the band a barrier.
+            for listener, future in calls:
+                try:
+                    if future is None:
+                        output.append(self._call_intercepted(
+                            channel, listener, args, kwargs))
+                    else:
+                        output.append(future.result())
+                except self.throws:
+                    raise
+                except:
+                    exc = self._listener_failed(exc, channel, listener)
+        if exc:
+            raise exc
+        return output
+
+    def _run_band_listener(self, channel, listener, args, kwargs):
+        """Call the given listener from a thread of self.executor."""
+        worker = self._band_worker
+        if not getattr(worker, 'seen', False):
+            worker.seen = True
+            self._executor_threads.add(threading.current_thread())
+        worker.active = True
+        try:
+            return self._call_intercepted(channel, listener, args, kwargs)
+        finally:
+            worker.active = False
+
+    def _listener_failed(self, exc, channel, listener):
+        """Record the current exception in exc (creating it if None)."""
+        if exc is None:
+            exc = self.publish_exception_class()
+        exc.handle_exception()
+
+        if channel == 'log':
+            # Assume any further messages to 'log' will fail.
+            pass
+        else:
+            self.log('Error in %r listener %r' % (channel, listener),
+                     level=40, traceback=True)
+        return exc
+
+    def wait(self, state, interval=0.1, channel=None, sleep=False,
+             timeout=None):
+        """Wait for the given state(s), publishing to channel at intervals.
+
+        The calling thread blocks until the bus enters one of the given
+        states, publishing to the given channel (if any) each time the
+        interval elapses and once more upon waking. Return the state which
+        was reached, or None if the optional timeout (in seconds) elapsed
+        first.
+
+        Waiting threads do not consume any file descriptors; the bus wakes
+        exactly those threads which wait for the state it enters. The
+        state is still checked each interval, so a transition made by a
+        signal handler on the waiting thread itself (which must not wake
+        it through a lock that thread may hold) is noticed promptly. The
+        'sleep' argument is accepted for compatibility and has no effect.
         """
         if isinstance(state, (tuple, list)):
-            _states_to_wait_for = state
+            states_to_wait_for = tuple(state)
         else:
-            _states_to_wait_for = [state]
+            states_to_wait_for = (state,)
+
+        reached = []
+        event = threading.Event()
+        waiter = threading.get_ident()
+
+        def callback(newstate):
+            reached.append(newstate)
+            # A signal handler on the waiting thread may have interrupted
+            # event.wait() while it holds the Event's own lock.
+            if threading.get_ident() != waiter:
+                event.set()
+
+        current = self._watch_states(states_to_wait_for, callback)
+        if current is not None:
+            return current
+
+        if timeout is not None:
+            deadline = time.monotonic() + timeout
+        try:
+            while True:
+                if reached:
+                    return reached[0]
+                current = self.state
+                if current in states_to_wait_for:
+                    return current
+                if timeout is None:
+                    event.wait(interval)
+                else:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return None
+                    event.wait(min(interval, remaining))
+                if channel is not None:
+                    self.call_threadsafe(self.publish, channel)
+        finally:
+            self._unwatch_states(states_to_wait_for, callback)
 
-        if select:
-            pipe = os.pipe()
-            read_fd, write_fd = pipe
-            self._state_transition_pipes.add(pipe)
-            if epoll:
-                poller = epoll(1)
-                poller.register(read_fd, select.EPOLLIN)
+    async def wait_async(self, state, timeout=None):
+        """Await the given state(s) from a running asyncio event loop.
+
+        Return the state which was reached, or None if the optional timeout
+        (in seconds) elapsed first. The waiting coroutine is resolved by
+        whichever thread makes the transition, so no thread is parked and
+        the bus state is never polled.
+        """
+        import asyncio
+
+        if isinstance(state, (tuple, list)):
+            states_to_wait_for = tuple(state)
+        else:
+            states_to_wait_for = (state,)
 
-        def _wait():
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def resolve(newstate):
+            if not future.done():
+                future.set_result(newstate)
+
+        def callback(newstate):
             try:
-                while self.state not in _states_to_wait_for:
-                    if select:
-                        try:
-                            if epoll:
-                                readers = poller.poll(interval)
-                            else:
-                                readers = select.select([read_fd], [], [], interval)[0]
-                            if readers:
-                                os.read(read_fd, 1)
-                        except (select.error, OSError):
-                            # Interrupted due to a signal (being handled by some
-                            # other thread). No need to panic, here, just check
-                            # the new state and proceed/return.
-                            pass
-                    else:
-                        time.sleep(interval)
-                    self.publish(channel)
-            finally:
-                self._state_transition_pipes.discard(pipe)
-                if epoll:
-                    poller.close()
-                # NOTE: Closing the write file descriptor first
-                # NOTE: to prevent "Broken pipe" in `self._transition()`.
-                os.close(write_fd)
-                os.close(read_fd)
-
-        # From http://psyco.sourceforge.net/psycoguide/bugs.html:
-        # "The compiled machine code does not include the regular polling
-        # done by Python, meaning that a KeyboardInterrupt will not be
-        # detected before execution comes back to the regular Python
-        # interpreter. Your program cannot be interrupted if caught
-        # into an infinite Psyco-compiled loop."
+                loop.call_soon_threadsafe(resolve, newstate)
+            except RuntimeError:
+                # The loop was closed while we were still registered.
+                pass
+
+        current = self._watch_states(states_to_wait_for, callback)
+        if current is not None:
+            return current
+
         try:
-            sys.modules['psyco'].cannotcompile(_wait)
-        except (KeyError, AttributeError):
-            pass
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            self._unwatch_states(states_to_wait_for, callback)
+
+    def _watch_states(self, states, callback):
+        """Call callback(state) when the bus enters any of the given states.
+
+        If the bus is already in one of them, return the current state
+        without registering the callback. Otherwise, return None; callers
+        MUST pass the same arguments to self._unwatch_states when done.
+        """
+        with self._state_lock:
+            if self.state in states:
+                return self.state
+            for s in states:
+                self._state_waiters.setdefault(s, set()).add(callback)
+        return None
+
+    def _unwatch_states(self, states, callback):
+        """Unregister a callback registered via self._watch_states."""
+        with self._state_lock:
+            for s in states:
+                waiters = self._state_waiters.get(s)
+                if waiters:
+                    waiters.discard(callback)
+                    if not waiters:
+                        del self._state_waiters[s]
+
+    def stats(self):
+        """Return listener timings if self.listener_stats is set, else {}.
+
+        See :meth:`ListenerStats.summary <magicbus.stats.ListenerStats.summary>`.
+        """
+        if self.listener_stats is None:
+            return {}
+        return self.listener_stats.summary()
 
-        _wait()
+    def log_stats(self, level=20):
+        """Log listener timings (if recorded), slowest listeners first."""
+        if self.listener_stats is not None:
+            lines = self.listener_stats.format()
+            self.log('Listener timings:\n' + '\n'.join(lines), level)
 
     def log(self, msg='', level=20, traceback=False):
         """Log the given message. Append the last traceback if requested."""
@@ -390,5 +1134,7 @@ class Bus:
                 exc_info = sys.exc_info()
             else:
                 exc_info = traceback
+            # Imported here since it is slow to import and rarely needed.
+            import traceback as _traceback
             msg += '\n' + ''.join(_traceback.format_exception(*exc_info))
         self.publish('log', msg, level)
@@ -0,0 +1,330 @@
+"""Micro-benchmarks for the Bus hot paths.
+
+Run all benchmarks and print a table::
+
+    python -m magicbus.bench
+
+Save machine-readable results, then compare a later run against them::
+
+    python -m magicbus.bench --json -o baseline.json
+    python -m magicbus.bench --baseline baseline.json
+
+When comparing, any benchmark whose median time per operation grew by more
+than ``--threshold`` (10% by default) is reported as a regression, and the
+exit status is 1. Use ``-k`` to run only benchmarks whose names contain the
+given substring.
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+import magicbus
+from magicbus.base import Bus, ChannelFailures, Graph
+from magicbus.process import ProcessBus
+from magicbus.stats import ListenerStats
+
+benchmarks = {}
+"""A map of {name: func(loops) -> seconds} of registered benchmarks."""
+
+
+def benchmark(name):
+    """Register the decorated func(loops) under the given name.
+
+    The function must run its operation 'loops' times and return the
+    number of seconds taken, excluding any setup.
+    """
+    def register(func):
+        benchmarks[name] = func
+        return func
+    return register
+
+
+def _noop(*args, **kwargs):
+    pass
+
+
+def _fail(*args, **kwargs):
+    raise ValueError('benchmark failure')
+
+
+def _publish(listeners, failing=False, stats=False):
+    def run(loops):
+        bus = Bus(extra_channels=('bench', 'log'))
+        if stats:
+            bus.listener_stats = ListenerStats()
+        for i in range(listeners):
+            # Distinct callables, since a bus dedupes identical listeners.
+            bus.subscribe('bench', _fail if failing and i == 0
+                          else lambda *a, **kw: None)
+        publish = bus.publish
+        started = time.perf_counter()
+        if failing:
+            for _ in range(loops):
+                try:
+                    publish('bench', 1, b=2)
+                except ChannelFailures:
+                    pass
+        else:
+            for _ in range(loops):
+                publish('bench', 1, b=2)
+        return time.perf_counter() - started
+    return run
+
+
+for _n in (0, 1, 10, 100):
+    benchmark('publish[%d]' % _n)(_publish(_n))
+for _n in (1, 10, 100):
+    benchmark('publish_failing[%d]' % _n)(_publish(_n, failing=True))
+# Compare with publish[n] for the overhead of listener stats.
+for _n in (1, 10, 100):
+    benchmark('publish_stats[%d]' % _n)(_publish(_n, stats=True))
+
+
+@benchmark('stats_record')
+def stats_record(loops):
+    """Record one listener call in a ListenerStats."""
+    record = ListenerStats().record
+    started = time.perf_counter()
+    for _ in range(loops):
+        record('bench', _noop, 12345, 6789)
+    return time.perf_counter() - started
+
+
+@benchmark('subscribe_churn')
+def subscribe_churn(loops):
+    """Subscribe and unsubscribe one listener among 10 others."""
+    bus = Bus(extra_channels=('bench', 'log'))
+    for i in range(10):
+        bus.subscribe('bench', lambda: None, priority=i * 10)
+    subscribe, unsubscribe = bus.subscribe, bus.unsubscribe
+    started = time.perf_counter()
+    for _ in range(loops):
+        subscribe('bench', _noop, priority=45)
+        unsubscribe('bench', _noop)
+    return time.perf_counter() - started
+
+
+def _chain(size):
+    """Return edges for a ring of 'size' states: s0 -> s1 -> ... -> s0."""
+    return dict(('s%d' % i, 's%d' % ((i + 1) % size)) for i in range(size))
+
+
+def _from_edges(size):
+    def run(loops):
+        edges = _chain(size)
+        # Bypass the Graph cache, which would otherwise dominate.
+        clear = Graph._from_frozen_edges.cache_clear
+        started = time.perf_counter()
+        for _ in range(loops):
+            clear()
+            Graph.from_edges(edges)
+        return time.perf_counter() - started
+    return run
+
+
+for _n in (4, 16, 64):
+    benchmark('graph_from_edges[%d]' % _n)(_from_edges(_n))
+
+
+def _transition(hops):
+    def run(loops):
+        # A ring of hops + 1 states, so that each loop moves
+        # 'hops' steps forward and then one more back to the start.
+        bus = Bus(_chain(hops + 1), initial_state='s0')
+        for state in bus.states:
+            bus.subscribe(state, _noop)
+        last = 's%d' % hops
+        transition = bus.transition
+        started = time.perf_counter()
+        for _ in range(loops):
+            transition(last)
+            transition('s0')
+        return time.perf_counter() - started
+    return run
+
+
+for _n in (1, 4, 16):
+    benchmark('transition[%d]' % _n)(_transition(_n))
+
+
+def _wait(threads):
+    def run(loops):
+        """Return the time from entering a state until all waiters woke."""
+        total = 0.0
+        for _ in range(loops):
+            bus = Bus({'IDLE': 'RUN', 'RUN': 'IDLE'}, initial_state='IDLE')
+            woke = []
+
+            def waiter():
+                bus.wait('RUN', interval=10)
+                woke.append(time.perf_counter())
+
+            workers = [threading.Thread(target=waiter)
+                       for _ in range(threads)]
+            for t in workers:
+                t.start()
+            while len(bus._state_waiters.get('RUN', ())) < threads:
+                time.sleep(0.0001)
+            started = time.perf_counter()
+            bus.transition('RUN')
+            for t in workers:
+                t.join()
+            total += max(woke) - started
+        return total
+    return run
+
+
+for _n in (1, 10, 100):
+    benchmark('wait_wakeup[%d]' % _n)(_wait(_n))
+
+
+@benchmark('processbus_init')
+def processbus_init(loops):
+    """Create a ProcessBus, with its default transitions and plugins."""
+    started = time.perf_counter()
+    for _ in range(loops):
+        ProcessBus()
+    return time.perf_counter() - started
+
+
+@benchmark('import_magicbus')
+def import_magicbus(loops):
+    """Return the time 'import magicbus' takes in fresh interpreters.
+
+    This uses the interpreter's own -X importtime report, so that
+    interpreter startup is excluded.
+    """
+    env = os.environ.copy()
+    env['PYTHONPATH'] = os.path.dirname(os.path.dirname(magicbus.__file__))
+    total = 0.0
+    for _ in range(loops):
+        report = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', 'import magicbus'],
+            env=env, stderr=subprocess.PIPE, check=True,
+            universal_newlines=True).stderr
+        for line in report.splitlines():
+            fields = line.split('|')
+            if len(fields) == 3 and fields[2].strip() == 'magicbus':
+                # The cumulative time in microseconds.
+                total += int(fields[1]) / 1e6
+    return total
+
+
+def measure(func, min_time=0.1, repeat=5):
+    """Return a dict of loops and min/median seconds per loop for func.
+
+    The number of loops is doubled until one run takes at least min_time
+    seconds; then the run is repeated 'repeat' times.
+    """
+    loops = 1
+    while True:
+        elapsed = func(loops)
+        if elapsed >= min_time or loops >= 1 << 30:
+            break
+        loops *= 2
+    times = [elapsed / loops]
+    for _ in range(repeat - 1):
+        times.append(func(loops) / loops)
+    return {
+        'loops': loops,
+        'min': min(times),
+        'median': statistics.median(times),
+    }
+
+
+def run(names=None, min_time=0.1, repeat=5):
+    """Run the named (default all) benchmarks; return {name: result}."""
+    if names is None:
+        names = list(benchmarks)
+    return dict(
+        (name, measure(benchmarks[name], min_time, repeat))
+        for name in names
+    )
+
+
+def compare(results, baseline, threshold=0.1):
+    """Return a list of (name, baseline, current, ratio, regressed).
+
+    Times are median seconds per loop; benchmarks missing from either
+    set of results are skipped.
+    """
+    rows = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        old, new = baseline[name]['median'], result['median']
+        ratio = new / old if old else float('inf')
+        rows.append((name, old, new, ratio, ratio > 1 + threshold))
+    return rows
+
+
+def _format_time(seconds):
+    for unit, scale in (('s', 1), ('ms', 1e3), ('us', 1e6)):
+        if seconds >= 1 / scale:
+            return '%.3f %s' % (seconds * scale, unit)
+    return '%.1f ns' % (seconds * 1e9)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m magicbus.bench', description=__doc__.split('\n')[0])
+    parser.add_argument('-k', dest='filter', default='',
+                        help='run only benchmarks whose names contain this')
+    parser.add_argument('--min-time', type=float, default=0.1,
+                        help='minimum seconds per run (default 0.1)')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='runs per benchmark (default 5)')
+    parser.add_argument('--json', action='store_true',
+                        help='write results as JSON')
+    parser.add_argument('-o', '--output', help='write to this file')
+    parser.add_argument('--baseline',
+                        help='compare against this JSON results file')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='slowdown ratio counted as a regression')
+    args = parser.parse_args(argv)
+
+    names = [n for n in benchmarks if args.filter in n]
+    results = run(names, args.min_time, args.repeat)
+
+    out = open(args.output, 'w') if args.output else sys.stdout
+    try:
+        if args.json:
+            json.dump({
+                'python': platform.python_version(),
+                'implementation': platform.python_implementation(),
+                'results': results,
+            }, out, indent=2, sort_keys=True)
+            out.write('\n')
+        elif not args.baseline:
+            for name in names:
+                out.write('%-24s %12s/op  (%d loops)\n' % (
+                    name, _format_time(results[name]['median']),
+                    results[name]['loops']))
+    finally:
+        if args.output:
+            out.close()
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+        regressions = 0
+        for name, old, new, ratio, regressed in compare(
+                results, baseline, args.threshold):
+            regressions += regressed
+            sys.stderr.write('%-24s %12s -> %12s  %6.2fx%s\n' % (
+                name, _format_time(old), _format_time(new), ratio,
+                '  REGRESSION' if regressed else ''))
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
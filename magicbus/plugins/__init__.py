@@ -7,6 +7,13 @@ class SimplePlugin:
     bus = None
     """A :class:`Bus <magicbus.Bus>`."""
 
+    weak = False
+    """If True, subscribe() only holds weak references to this plugin.
+
+    The bus then unsubscribes the plugin automatically once it is
+    garbage-collected, so short-lived plugins need not be unsubscribed.
+    """
+
     def __init__(self, bus):
         self.bus = bus
 
@@ -15,7 +22,7 @@ class SimplePlugin:
         for channel in self.bus.listeners:
             method = getattr(self, channel, None)
             if method is not None:
-                self.bus.subscribe(channel, method)
+                self.bus.subscribe(channel, method, weak=self.weak)
 
     def unsubscribe(self):
         """Unregister this object as a listener on the bus."""
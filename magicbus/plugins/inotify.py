@@ -0,0 +1,175 @@
+"""File change notification via Linux inotify, for the Autoreloader.
+
+This talks to the C library through ctypes, so it needs no extra
+dependencies; :func:`available` tells whether it can be used here.
+"""
+
+import ctypes
+import errno
+import os
+import struct
+import sys
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+
+IN_CLOEXEC = 0o2000000
+IN_NONBLOCK = 0o4000
+
+_event = struct.Struct('iIII')
+
+_libc = None
+
+
+def _load_libc():
+    """Return the C library, with the inotify functions declared."""
+    global _libc
+    if _libc is None:
+        # dlopen(NULL) finds libc without a (slow) find_library call.
+        libc = ctypes.CDLL(None, use_errno=True)
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [
+            ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+        _libc = libc
+    return _libc
+
+
+def available():
+    """Return True if inotify can be used on this platform."""
+    if not sys.platform.startswith('linux'):
+        return False
+    try:
+        _load_libc()
+    except (OSError, AttributeError):
+        # No C library, or one without inotify_init1.
+        return False
+    return True
+
+
+def _check(result):
+    if result < 0:
+        code = ctypes.get_errno()
+        raise OSError(code, os.strerror(code))
+    return result
+
+
+class Inotify:
+    """A non-blocking inotify instance."""
+
+    def __init__(self):
+        self.libc = _load_libc()
+        self.fd = _check(self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC))
+
+    def fileno(self):
+        return self.fd
+
+    def add_watch(self, path, mask):
+        """Watch the given path for the given events; return the watch id."""
+        return _check(self.libc.inotify_add_watch(
+            self.fd, os.fsencode(path), mask))
+
+    def rm_watch(self, wd):
+        """Stop watching the given watch id."""
+        _check(self.libc.inotify_rm_watch(self.fd, wd))
+
+    def read(self):
+        """Return a list of pending (wd, mask, cookie, name) events."""
+        events = []
+        while self.fd is not None:
+            try:
+                data = os.read(self.fd, 65536)
+            except OSError as exc:
+                if exc.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    return events
+                raise
+            offset = 0
+            while offset < len(data):
+                wd, mask, cookie, length = _event.unpack_from(data, offset)
+                offset += _event.size
+                name = data[offset:offset + length].rstrip(b'\0')
+                offset += length
+                events.append((wd, mask, cookie, os.fsdecode(name)))
+        return events
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+class InotifyWatcher:
+    """Report changes to a set of files by watching their directories.
+
+    Watching directories, rather than the files themselves, also catches
+    files which are replaced by a rename (as many editors and deployment
+    tools do). Only writes, moves and deletes count as changes.
+    """
+
+    mask = (IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_DELETE |
+            IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR)
+
+    def __init__(self):
+        self.inotify = Inotify()
+        # A map of {directory: set of watched file names}.
+        self.files = {}
+        # A map of {watch id: directory}.
+        self.dirs = {}
+        # Every file passed to watch(), so each is considered only once.
+        self.seen = set()
+
+    def watch(self, filename):
+        """Report changes to the given file (if it exists) from now on.
+
+        OSError is raised if its directory cannot be watched; for example,
+        ENOSPC when the inotify watches of the user (see
+        /proc/sys/fs/inotify/max_user_watches) are used up.
+        """
+        if filename in self.seen:
+            return
+        if not os.path.exists(filename):
+            # A module with no source file, or a zip archive member.
+            self.seen.add(filename)
+            return
+        directory, name = os.path.split(filename)
+        names = self.files.get(directory)
+        if names is None:
+            wd = self.inotify.add_watch(directory, self.mask)
+            self.dirs[wd] = directory
+            names = self.files[directory] = set()
+        self.seen.add(filename)
+        names.add(name)
+
+    def changes(self):
+        """Return the set of watched files which changed since last called.
+
+        If the kernel dropped events, all watched files are returned.
+        """
+        changed = set()
+        for wd, mask, cookie, name in self.inotify.read():
+            if mask & IN_Q_OVERFLOW:
+                for directory, names in self.files.items():
+                    changed.update(os.path.join(directory, n) for n in names)
+                continue
+            directory = self.dirs.get(wd)
+            if directory is None:
+                continue
+            names = self.files[directory]
+            if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                changed.update(os.path.join(directory, n) for n in names)
+            elif name in names:
+                changed.add(os.path.join(directory, name))
+        return changed
+
+    def close(self):
+        self.inotify.close()
@@ -32,7 +32,11 @@ class CleanExit(plugins.SimplePlugin):
                 'shutting it down automatically now. You must either call '
                 'bus.block() after start(), or call bus.exit() before the '
                 'main thread exits.' % self.bus.state, RuntimeWarning)
-            self.bus.transition('EXITED')
+            result = self.bus.transition('EXITED')
+            if not isinstance(result, list):
+                # An AsyncProcessBus; the main loop is gone by now.
+                import asyncio
+                asyncio.run(result)
 
 
 class ThreadWait(plugins.SimplePlugin):
@@ -44,10 +48,16 @@ class ThreadWait(plugins.SimplePlugin):
         # the main thread to call atexit handlers.
         # See http://www.cherrypy.org/ticket/751.
         self.bus.log('Waiting for child threads to terminate...')
+        # The workers of bus.executor only exit when it is shut down,
+        # which is left to its owner (possibly after EXITED).
+        workers = getattr(self.bus, '_executor_threads', ())
         for t in threading.enumerate():
             if t == threading.current_thread() or not t.is_alive():
                 continue
 
+            if t in workers:
+                continue
+
             # Note that any dummy (external) threads are always daemonic.
             if t.daemon or isinstance(t, threading._MainThread):
                 continue
@@ -178,17 +178,17 @@ class ServerPlugin:
         except KeyboardInterrupt:
             self.bus.log('<Ctrl-C> hit: shutting down HTTP server')
             self.interrupt = sys.exc_info()[1]
-            self.bus.transition('EXITED')
+            self.bus.call_threadsafe(self.bus.transition, 'EXITED')
         except SystemExit:
             self.bus.log('SystemExit raised: shutting down HTTP server')
             self.interrupt = sys.exc_info()[1]
-            self.bus.transition('EXITED')
+            self.bus.call_threadsafe(self.bus.transition, 'EXITED')
             raise
         except:
             self.interrupt = sys.exc_info()[1]
             self.bus.log('Error in HTTP server: shutting down',
                          traceback=True, level=40)
-            self.bus.transition('EXITED')
+            self.bus.call_threadsafe(self.bus.transition, 'EXITED')
             raise
 
     def wait(self):
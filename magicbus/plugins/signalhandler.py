@@ -58,7 +58,7 @@ class SignalHandler:
     def _jython_SIGINT_handler(self, signum=None, frame=None):
         # See http://bugs.jython.org/issue1313
         self.bus.log('Keyboard Interrupt: shutting down bus')
-        self.bus.transition('EXITED')
+        self.bus.call_threadsafe(self.bus.transition, 'EXITED')
 
     def subscribe(self):
         self.bus.subscribe('ENTER', self.subscribe_handlers)
@@ -128,19 +128,21 @@ class SignalHandler:
         """Python signal handler (self.set_handler subscribes it for you)."""
         signame = self.signals[signum]
         self.bus.log('Caught signal %s.' % signame)
-        self.bus.publish(signame)
+        # The handler may interrupt an event loop which runs the bus.
+        self.bus.call_threadsafe(self.bus.publish, signame)
 
     def handle_SIGTERM(self):
         """Transition to the EXITED state."""
         self.bus.log('SIGTERM caught. Exiting.')
-        self.bus.transition('EXITED')
+        # Return the result, which an asyncio bus awaits.
+        return self.bus.transition('EXITED')
 
     def handle_SIGHUP(self):
         """Restart if daemonized, else exit."""
         if os.isatty(sys.stdin.fileno()):
             # not daemonized (may be foreground or background)
             self.bus.log('SIGHUP caught but not daemonized. Exiting.')
-            self.bus.transition('EXITED')
+            return self.bus.transition('EXITED')
         else:
             self.bus.log('SIGHUP caught while daemonized. Restarting.')
-            self.bus.restart()
+            return self.bus.restart()
@@ -1,10 +1,18 @@
 """Repeating tasks and monitors for a Bus."""
 
+import collections
+import functools
+import hashlib
+import heapq
+import itertools
 import os
+import random
 import re
 import sys
 import time
 import threading
+import types
+from concurrent.futures import Future, ThreadPoolExecutor
 
 from magicbus.plugins import SimplePlugin
 
@@ -27,24 +35,44 @@ from magicbus.plugins import SimplePlugin
 _module__file__base = os.getcwd()
 
 
+def _next_run(scheduled, interval):
+    """Return the fixed-rate run time which follows the given one.
+
+    Runs are scheduled at whole intervals from the first, so the time
+    taken by each run does not accumulate as drift. Any runs which were
+    missed (because a run overran its interval) are skipped, rather than
+    being run back-to-back to catch up.
+    """
+    scheduled += interval
+    now = time.monotonic()
+    if scheduled < now and interval > 0:
+        scheduled += ((now - scheduled) // interval + 1) * interval
+    return scheduled
+
+
 class PerpetualTimer(threading.Timer):
     """A responsive subclass of threading.Timer whose run() method repeats.
 
-    Use this timer only when you really need a very interruptible timer;
-    this checks its 'finished' condition up to 20 times a second, which can
-    result in pretty high CPU usage.
+    The timer waits on its 'finished' event between runs, so cancel() takes
+    effect immediately and an idle timer wakes only when a run is due. Runs
+    are scheduled at a fixed rate; see :func:`_next_run`.
     """
 
+    bus = None
+    """A Bus to log errors to, if any."""
+
     def run(self):
+        scheduled = time.monotonic()
         while True:
-            self.finished.wait(self.interval)
-            if self.finished.isSet():
+            scheduled = _next_run(scheduled, self.interval)
+            if self.finished.wait(max(0, scheduled - time.monotonic())):
                 return
             try:
                 self.function(*self.args, **self.kwargs)
             except Exception:
-                self.bus.log('Error in perpetual timer thread function %r.' %
-                             self.function, level=40, traceback=True)
+                if self.bus:
+                    self.bus.log('Error in perpetual timer thread function %r.'
+                                 % self.function, level=40, traceback=True)
                 # Quit on first error to avoid massive logs.
                 raise
 
@@ -52,11 +80,10 @@ class PerpetualTimer(threading.Timer):
 class BackgroundTask(threading.Thread):
     """A subclass of threading.Thread whose run() method repeats.
 
-    Use this class for most repeating tasks. It uses time.sleep() to wait
-    for each interval, which isn't very responsive; that is, even if you call
-    self.cancel(), you'll have to wait until the sleep() call finishes before
-    the thread stops. To compensate, it defaults to being daemonic, which means
-    it won't delay stopping the whole process.
+    Use this class for most repeating tasks. It waits for each interval on
+    a threading.Event, so cancel() wakes it immediately (though a run which
+    is already in progress is allowed to finish). Runs are scheduled at a
+    fixed rate; see :func:`_next_run`.
     """
 
     def __init__(self, interval, function, args=[], kwargs={}, bus=None):
@@ -66,24 +93,20 @@ class BackgroundTask(threading.Thread):
         self.args = args
         self.kwargs = kwargs
         self.running = False
+        self.finished = threading.Event()
         self.bus = bus
 
     def cancel(self):
         self.running = False
+        self.finished.set()
 
     def run(self):
-        self.running = True
+        self.running = not self.finished.is_set()
+        scheduled = time.monotonic()
         while self.running:
-            # Sleep. Split up so we respond to cancel within one second.
-            wholesecs, fracsecs = divmod(self.interval, 1)
-            for s in range(int(wholesecs)):
-                time.sleep(1)
-                if not self.running:
-                    return
-            if fracsecs:
-                time.sleep(fracsecs)
-                if not self.running:
-                    return
+            scheduled = _next_run(scheduled, self.interval)
+            if self.finished.wait(max(0, scheduled - time.monotonic())):
+                return
 
             try:
                 self.function(*self.args, **self.kwargs)
@@ -94,12 +117,13 @@ class BackgroundTask(threading.Thread):
                 # Quit on first error to avoid massive logs.
                 raise
 
-    def _set_daemon(self):
-        return True
-
 
 class Monitor(SimplePlugin):
-    """WSPBus listener to periodically run a callback in its own thread."""
+    """WSPBus listener to periodically run a callback in its own thread.
+
+    If a :class:`Scheduler` is given, the callback is run as one of its
+    jobs instead, so that many monitors can share its threads.
+    """
 
     callback = None
     """The function to call at intervals."""
@@ -111,18 +135,33 @@ class Monitor(SimplePlugin):
     """A :class:`BackgroundTask<magicbus.plugins.tasks.BackgroundTask>` thread.
     """
 
-    def __init__(self, bus, callback, frequency=60, name=None):
+    scheduler = None
+    """A :class:`Scheduler` to run the callback, instead of our own thread."""
+
+    job = None
+    """The :class:`ScheduledJob` for the callback, if using a scheduler."""
+
+    def __init__(self, bus, callback, frequency=60, name=None, scheduler=None):
         SimplePlugin.__init__(self, bus)
         self.callback = callback
         self.frequency = frequency
         self.thread = None
         self.name = name
+        self.scheduler = scheduler
+        self.job = None
 
     def START(self):
         """Start our callback in its own background thread."""
         if self.frequency > 0:
             threadname = self.name or self.__class__.__name__
-            if self.thread is None:
+            if self.scheduler is not None:
+                if self.job is None:
+                    self.job = self.scheduler.schedule(
+                        self.callback, self.frequency, name=threadname)
+                    self.bus.log('Scheduled monitor %r.' % threadname)
+                else:
+                    self.bus.log('Monitor %r already scheduled.' % threadname)
+            elif self.thread is None:
                 self.thread = BackgroundTask(self.frequency, self.callback,
                                              bus=self.bus)
                 self.thread.setName(threadname)
@@ -134,7 +173,11 @@ class Monitor(SimplePlugin):
 
     def STOP(self):
         """Stop our callback's background task thread."""
-        if self.thread is None:
+        if self.job is not None:
+            self.job.cancel()
+            self.bus.log('Unscheduled monitor %r.' % self.job.name)
+            self.job = None
+        elif self.thread is None:
             self.bus.log('No thread running for %s.' %
                          self.name or self.__class__.__name__)
         else:
@@ -167,6 +210,16 @@ class Autoreloader(Monitor):
     Like all :class:`Monitor<magicbus.plugins.tasks.Monitor>` plugins,
     the autoreload plugin takes a ``frequency`` argument. The default is
     1 second; that is, the autoreloader will examine files once each second.
+
+    On Linux, the autoreloader asks the kernel (via inotify) to report
+    writes, moves and deletes in the directories of the monitored files,
+    so each check only reads the pending events. Elsewhere, or with
+    ``backend='stat'``, it checks the modification time of every file;
+    so it does for files whose directories inotify fails to watch (when
+    the watches of the user are used up, say), logging a warning.
+
+    With ``mode='reload'``, changed modules are reloaded in place rather
+    than re-executing the process; see :meth:`reload`.
     """
 
     files = None
@@ -178,70 +231,841 @@ class Autoreloader(Monitor):
     match = '.*'
     """A regular expression by which to match filenames."""
 
-    def __init__(self, bus, frequency=1, match='.*'):
-        self.mtimes = {}
+    backend = 'auto'
+    """How to detect changes: 'inotify', 'stat' or 'auto'.
+
+    The default, 'auto', uses inotify where it is available and
+    falls back to 'stat' (polling modification times) elsewhere.
+    """
+
+    watcher = None
+    """The :class:`InotifyWatcher<magicbus.plugins.inotify.InotifyWatcher>`,
+    if using inotify."""
+
+    max_backoff = 8
+    """The longest interval between polls, as a multiple of frequency.
+
+    Files which are not watched via inotify are polled; each poll which
+    finds no changes doubles the interval until the next one, up to this
+    limit, and any change resets it. Set this to 1 to poll at every tick.
+    """
+
+    debounce = 0.5
+    """Seconds without further changes to wait for before restarting.
+
+    Changes which arrive in a burst (from a VCS checkout or a deployment,
+    say) are thereby coalesced into a single restart, which does not
+    happen while files are still being written.
+    """
+
+    verify = False
+    """If True, only restart for files whose contents have changed.
+
+    Files are hashed when first tracked, and again when they appear
+    changed, so that rewriting or touching a file with identical bytes
+    does not restart the process. Note this reads every tracked file
+    once at startup.
+    """
+
+    mode = 'execv'
+    """What to do when files change: 'execv' (the default) or 'reload'.
+
+    'execv' restarts the whole process via bus.restart(); 'reload' reloads
+    just the changed modules (see :meth:`reload`), and falls back to
+    bus.restart() if that fails.
+    """
+
+    mtimes = None
+    """A map of {directory: {filename: mtime}} of the files being polled."""
+
+    digests = None
+    """A map of {filename: content digest} of tracked files, if verifying."""
+
+    def __init__(self, bus, frequency=1, match='.*', backend='auto',
+                 scheduler=None, mode='execv'):
+        if backend not in ('auto', 'inotify', 'stat'):
+            raise ValueError("backend must be 'auto', 'inotify' or 'stat', "
+                             'not %r.' % backend)
+        if mode not in ('execv', 'reload'):
+            raise ValueError("mode must be 'execv' or 'reload', not %r."
+                             % mode)
         self.files = set()
         self.match = match
-        Monitor.__init__(self, bus, self.run, frequency)
+        self.backend = backend
+        self.mode = mode
+        self.watcher = None
+        # True while reload() moves the bus through IDLE back to RUN.
+        self._reloading = False
+        self._reset()
+        Monitor.__init__(self, bus, self.run, frequency, scheduler=scheduler)
+        self.bus.listeners.setdefault('reload', set())
+
+    def _reset(self):
+        """Forget all tracked modules and files."""
+        self.mtimes = {}
+        self.digests = {}
+        # Changed files which are waiting for the debounce window to end.
+        self._pending = set()
+        self._last_change = None
+        # The sys.modules entries (and files) seen by new_sysfiles().
+        self._modules = {}
+        self._modules_dict = None
+        self._modules_len = None
+        self._modules_match = None
+        # Every filename passed to track().
+        self._tracked = set()
+        # Ticks between polls, and ticks left until the next poll.
+        self._backoff = 1
+        self._skip = 0
 
     def START(self):
         """Start our own background task thread for self.run."""
-        if self.thread is None:
-            self.mtimes = {}
+        if self._reloading:
+            # Our thread is the one reloading; keep it.
+            return
+        if self.thread is None and self.job is None:
+            self._reset()
+            if self.backend != 'stat':
+                from magicbus.plugins import inotify
+                if self.backend == 'inotify' or inotify.available():
+                    self.watcher = inotify.InotifyWatcher()
         Monitor.START(self)
     START.priority = 70
 
+    def STOP(self):
+        """Stop our background task thread, and any inotify watcher."""
+        if self._reloading:
+            return
+        Monitor.STOP(self)
+        if self.watcher is not None:
+            self.watcher.close()
+            self.watcher = None
+
+    @staticmethod
+    def _module_file(m):
+        """Return the (absolute) file of the given module, or None."""
+        if hasattr(m, '__loader__') and hasattr(m.__loader__, 'archive'):
+            return m.__loader__.archive
+        f = getattr(m, '__file__', None)
+        if f is not None and not os.path.isabs(f):
+            # ensure absolute paths so a os.chdir() in the app
+            # doesn't break me
+            f = os.path.normpath(os.path.join(_module__file__base, f))
+        return f
+
     def sysfiles(self):
         """Return a Set of sys.modules filenames to monitor."""
         files = set()
         for k, m in list(sys.modules.items()):
             if re.match(self.match, k):
-                if (
-                    hasattr(m, '__loader__') and
-                    hasattr(m.__loader__, 'archive')
-                ):
-                    f = m.__loader__.archive
-                else:
-                    f = getattr(m, '__file__', None)
-                    if f is not None and not os.path.isabs(f):
-                        # ensure absolute paths so a os.chdir() in the app
-                        # doesn't break me
-                        f = os.path.normpath(
-                            os.path.join(_module__file__base, f))
-                files.add(f)
+                files.add(self._module_file(m))
         return files
 
+    def new_sysfiles(self):
+        """Return filenames of sys.modules entries added since last called.
+
+        Entries are only looked for when sys.modules has changed size (or
+        self.match has changed), so this is cheap to call at every tick;
+        and then only new entries are matched and examined.
+        """
+        modules = sys.modules
+        if (
+            modules is self._modules_dict and
+            len(modules) == self._modules_len and
+            self.match == self._modules_match
+        ):
+            return set()
+        if self.match != self._modules_match:
+            self._modules = {}
+        self._modules_dict = modules
+        self._modules_len = len(modules)
+        self._modules_match = self.match
+
+        seen = self._modules
+        files = set()
+        for k, m in list(modules.items()):
+            if seen.get(k) is not m:
+                seen[k] = m
+                if re.match(self.match, k):
+                    files.add(self._module_file(m))
+        return files
+
+    def track(self, filename):
+        """Watch the given file for changes, if it exists."""
+        self._tracked.add(filename)
+        if filename.endswith('.pyc'):
+            filename = filename[:-1]
+        if self.verify and filename not in self.digests:
+            self.digests[filename] = self._digest(filename)
+        if self.watcher is not None:
+            try:
+                self.watcher.watch(filename)
+                return
+            except OSError as exc:
+                directory = os.path.dirname(filename)
+                if directory not in self.mtimes:
+                    self.bus.log('Polling %s instead: inotify cannot watch '
+                                 'it (%s).' % (directory, exc), level=30)
+
+        try:
+            mtime = os.stat(filename).st_mtime
+        except OSError:
+            # Either a module with no .py file, or it's been deleted.
+            return
+        directory, name = os.path.split(filename)
+        self.mtimes.setdefault(directory, {}).setdefault(name, mtime)
+
     def run(self):
         """Reload the process if registered files have been modified."""
-        for filename in self.sysfiles() | self.files:
+        for filename in self.new_sysfiles() | (self.files - self._tracked):
             if filename:
-                if filename.endswith('.pyc'):
-                    filename = filename[:-1]
+                self.track(filename)
 
-                oldtime = self.mtimes.get(filename, 0)
-                if oldtime is None:
-                    # Module with no .py file. Skip it.
-                    continue
+        changed = set()
+        if self.watcher is not None:
+            changed = self.watcher.changes()
+        if self.watcher is None or self.mtimes:
+            # Some (or all) files are polled instead.
+            if self._skip:
+                self._skip -= 1
+            else:
+                polled = self.poll()
+                if polled:
+                    self._backoff = 1
+                    changed |= polled
+                else:
+                    self._backoff = min(self._backoff * 2, self.max_backoff)
+                self._skip = self._backoff - 1
+
+        now = time.monotonic()
+        if changed:
+            self._pending.update(changed)
+            self._last_change = now
+        if not self._pending or now - self._last_change < self.debounce:
+            return
+        changed, self._pending = self._pending, set()
+        if self.verify:
+            changed = self._verify(changed)
+            if not changed:
+                return
+
+        if self.mode == 'reload':
+            self.bus.log('Reloading because %s changed.' %
+                         ', '.join(sorted(changed)))
+            if self.reload(changed):
+                return
+
+        self.bus.log('Restarting because %s changed.' %
+                     ', '.join(sorted(changed)))
+        if self.job is not None:
+            self.job.cancel()
+        elif self.thread is not None:
+            self.thread.cancel()
+            self.bus.log('Stopped thread %r.' % self.thread.getName())
+        self.bus.call_threadsafe(self.bus.restart)
+
+    def reload(self, files):
+        """Reload the modules of the given files in place; return success.
+
+        The bus moves to IDLE, and the names of the modules to reload are
+        published to the 'reload' channel. Those modules, and all modules
+        which (transitively) refer to them, are reloaded with
+        importlib.reload, each after the modules it refers to. The bus then
+        moves back to RUN.
+
+        If any of the files is not the source of a loaded module (or
+        is that of __main__), or if reloading fails, False is returned
+        and the caller should restart the process instead. False is also
+        returned for an :class:`AsyncBus <magicbus.aio.AsyncBus>`, whose
+        transitions cannot be awaited from the monitor thread.
+        """
+        import importlib
+        import inspect
+
+        if inspect.iscoroutinefunction(self.bus.transition):
+            self.bus.log('Cannot reload in place on an asyncio bus.')
+            return False
+
+        names = set()
+        found = set()
+        for name, m in list(sys.modules.items()):
+            f = self._module_file(m)
+            if f and f.endswith('.pyc'):
+                f = f[:-1]
+            if f in files:
+                names.add(name)
+                found.add(f)
+        if found != set(files) or '__main__' in names:
+            self.bus.log('Cannot reload %s in place.' %
+                         ', '.join(sorted(set(files) - found) or ['__main__']))
+            return False
+
+        order = self.reload_order(names)
+        self._reloading = True
+        try:
+            self.bus.transition('IDLE')
+            started = time.monotonic()
+            self.bus.publish('reload', order)
+            for name in order:
+                importlib.reload(sys.modules[name])
+            elapsed = time.monotonic() - started
+            self.bus.transition('RUN')
+        except Exception:
+            self.bus.log('Error reloading %s.' % ', '.join(order),
+                         level=40, traceback=True)
+            return False
+        finally:
+            self._reloading = False
+        self.bus.log('Reloaded %s in %.3fs.' % (', '.join(order), elapsed))
+        return True
+
+    @staticmethod
+    def _dependencies(m):
+        """Return the names of the modules which module m refers to."""
+        deps = set()
+        for value in list(vars(m).values()):
+            if isinstance(value, types.ModuleType):
+                deps.add(value.__name__)
+                continue
+            try:
+                owner = getattr(value, '__module__', None)
+            except Exception:
+                continue
+            if isinstance(owner, str):
+                deps.add(owner)
+        deps.discard(m.__name__)
+        return deps
+
+    def reload_order(self, names):
+        """Return the given modules and their dependents, in reload order.
+
+        Dependents are the modules matching self.match which refer to one
+        of the given modules, directly or via other dependents. Each module
+        comes after those it refers to (cycles are broken arbitrarily).
+        """
+        deps = {}
+        for name, m in list(sys.modules.items()):
+            if (
+                isinstance(m, types.ModuleType) and name != '__main__' and
+                (name in names or re.match(self.match, name))
+            ):
+                deps[name] = self._dependencies(m)
+
+        dependents = {}
+        for name, refs in deps.items():
+            for ref in refs:
+                dependents.setdefault(ref, []).append(name)
+        affected = set(names)
+        pending = list(names)
+        while pending:
+            for name in dependents.get(pending.pop(), ()):
+                if name not in affected:
+                    affected.add(name)
+                    pending.append(name)
+
+        order = []
+        visited = set()
+
+        def visit(name):
+            if name in visited:
+                return
+            visited.add(name)
+            for dep in sorted(deps.get(name, ()) & affected):
+                visit(dep)
+            order.append(name)
+
+        for name in sorted(affected):
+            visit(name)
+        return order
 
-                try:
-                    mtime = os.stat(filename).st_mtime
-                except OSError:
-                    # Either a module with no .py file, or it's been deleted.
-                    mtime = None
+    @staticmethod
+    def _digest(filename):
+        """Return a digest of the contents of the given file, or None."""
+        try:
+            with open(filename, 'rb') as f:
+                return hashlib.blake2b(f.read()).digest()
+        except OSError:
+            return None
 
-                if filename not in self.mtimes:
-                    # If a module has no .py file, this will be None.
-                    self.mtimes[filename] = mtime
+    def _verify(self, changed):
+        """Return those of the given files whose contents have changed."""
+        verified = set()
+        for filename in changed:
+            digest = self._digest(filename)
+            if digest is None or digest != self.digests.get(filename):
+                self.digests[filename] = digest
+                verified.add(filename)
+        if len(verified) < len(changed):
+            self.bus.log('Ignoring %d changed file(s) with unchanged contents.'
+                         % (len(changed) - len(verified)), level=10)
+        return verified
+
+    def poll(self):
+        """Return the set of tracked files modified since last polled.
+
+        Each directory is listed once (via os.scandir), so deleted files
+        cost nothing to find; only the entries of tracked files are then
+        stat'ed (which is free on Windows). Deleted files are reported
+        once and then no longer tracked.
+        """
+        changed = set()
+        for directory, mtimes in list(self.mtimes.items()):
+            missing = set(mtimes)
+            try:
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        oldtime = mtimes.get(entry.name)
+                        if oldtime is None:
+                            continue
+                        try:
+                            mtime = entry.stat().st_mtime
+                        except OSError:
+                            # Deleted since it was listed.
+                            continue
+                        missing.discard(entry.name)
+                        if mtime > oldtime:
+                            mtimes[entry.name] = mtime
+                            changed.add(entry.path)
+            except OSError:
+                # The whole directory is gone.
+                pass
+            for name in missing:
+                del mtimes[name]
+                filename = os.path.join(directory, name)
+                self._tracked.discard(filename)
+                changed.add(filename)
+            if not mtimes:
+                del self.mtimes[directory]
+        return changed
+
+
+class DispatchShard:
+    """A bounded event queue of a Dispatcher, and the thread draining it."""
+
+    queued = 0
+    """The number of events queued so far."""
+
+    dropped = 0
+    """The number of events dropped so far because the queue was full."""
+
+    dispatched = 0
+    """The number of events published so far."""
+
+    def __init__(self, bus, maxsize, overflow, name, local=None):
+        self.bus = bus
+        self.maxsize = maxsize
+        self.overflow = overflow
+        self.name = name
+        # Marks the threads of this shard, and of any shards sharing it.
+        self.local = threading.local() if local is None else local
+        self.queue = collections.deque()
+        self.mutex = threading.Lock()
+        self.not_empty = threading.Condition(self.mutex)
+        self.not_full = threading.Condition(self.mutex)
+        self.thread = None
+        self.stopping = False
+
+    def __len__(self):
+        return len(self.queue)
+
+    def put(self, event):
+        """Queue an event. Return False if it was dropped, else True."""
+        with self.mutex:
+            if self.maxsize and len(self.queue) >= self.maxsize:
+                if self.overflow == 'drop_oldest':
+                    self.queue.popleft()
+                    self.dropped += 1
+                elif (
+                    self.overflow == 'drop_newest' or
+                    self.thread is None or
+                    # Shards which wait on each other would deadlock.
+                    getattr(self.local, 'dispatching', False)
+                ):
+                    self.dropped += 1
+                    return False
                 else:
-                    if mtime is None or mtime > oldtime:
-                        # The file has been deleted or modified.
-                        self.bus.log('Restarting because %s changed.' %
-                                     filename)
-                        self.thread.cancel()
-                        self.bus.log('Stopped thread %r.' %
-                                     self.thread.getName())
-                        self.bus.restart()
-                        return
+                    while len(self.queue) >= self.maxsize:
+                        self.not_full.wait()
+            self.queue.append(event)
+            self.queued += 1
+            self.not_empty.notify()
+        return True
+
+    def start(self):
+        """Start the thread which drains the queue."""
+        self.stopping = False
+        self.thread = threading.Thread(target=self.run, name=self.name)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        """Wait for the queue to drain, then stop the thread."""
+        thread = self.thread
+        with self.mutex:
+            self.stopping = True
+            self.not_empty.notify()
+        if thread is not threading.current_thread():
+            thread.join()
+        self.thread = None
+
+    def run(self):
+        """Publish queued events until stopped and drained."""
+        self.local.dispatching = True
+        while True:
+            with self.mutex:
+                while not self.queue and not self.stopping:
+                    self.not_empty.wait()
+                if not self.queue:
+                    return
+                channel, args, kwargs = self.queue.popleft()
+                self.not_full.notify()
+
+            try:
+                result = self.bus.call_threadsafe(
+                    self.bus.publish, channel, *args, **kwargs)
+            except self.bus.publish_exception_class:
+                # Already logged by publish.
+                pass
+            except Exception:
+                self.bus.log('Error dispatching %r event.' % channel,
+                             level=40, traceback=True)
+            else:
+                if isinstance(result, Future):
+                    # An AsyncBus publishes on its event loop.
+                    result.add_done_callback(
+                        functools.partial(self._published, channel))
+            self.dispatched += 1
+
+    def _published(self, channel, future):
+        """Log any error of a publish scheduled on an event loop."""
+        if future.cancelled():
+            return
+        exc = future.exception()
+        if exc is not None and not isinstance(
+                exc, self.bus.publish_exception_class):
+            self.bus.log('Error dispatching %r event.' % channel, level=40,
+                         traceback=(type(exc), exc, exc.__traceback__))
+
+
+class Dispatcher(SimplePlugin):
+    """Bus plugin which publishes posted events from its own threads.
+
+    Once subscribed, :meth:`bus.post <magicbus.base.Bus.post>` and
+    :meth:`bus.post_keyed <magicbus.base.Bus.post_keyed>` hand events to
+    this plugin, which publishes them from background threads between the
+    START and STOP states. STOP waits for all queued events to be
+    published before stopping the threads, and therefore before
+    ThreadWait joins other threads on EXIT.
+
+    Events are spread over ``shards`` queues of at most ``maxsize``
+    entries each, with one thread per queue. Events posted with the same
+    key always go to the same shard, so they are published in order,
+    while events with different keys may be published in parallel.
+    Events posted without a key are spread round-robin over the shards;
+    with a single shard (the default), all events keep their order.
+
+    When a queue is full, ``overflow`` decides what happens to a new
+    event:
+
+        * 'block' (the default): the posting thread waits for room.
+          Events posted from any thread of the dispatcher, or while it
+          is not running, are dropped instead of waiting forever.
+        * 'drop_oldest': the oldest queued event is discarded.
+        * 'drop_newest': the new event is discarded.
+
+    On an :class:`AsyncBus <magicbus.aio.AsyncBus>`, the threads hand each
+    event to the event loop of the bus, via its ``call_threadsafe``
+    method, rather than publishing it themselves. The event loop starts
+    these publishes in order, but STOP does not wait for them to finish.
+    """
+
+    overflow_policies = ('block', 'drop_oldest', 'drop_newest')
+
+    def __init__(self, bus, maxsize=10000, overflow='block', name=None,
+                 shards=1):
+        if overflow not in self.overflow_policies:
+            raise ValueError('overflow must be one of %r, not %r.' %
+                             (self.overflow_policies, overflow))
+        if shards < 1:
+            raise ValueError('shards must be at least 1, not %r.' % shards)
+        SimplePlugin.__init__(self, bus)
+        self.name = name or self.__class__.__name__
+        local = threading.local()
+        self.shards = tuple([
+            DispatchShard(
+                bus, maxsize, overflow,
+                self.name if shards == 1 else '%s-%d' % (self.name, i),
+                local)
+            for i in range(shards)
+        ])
+        self._round_robin = itertools.cycle(self.shards)
+        self.running = False
+
+    def subscribe(self):
+        """Register this object as a listener and as the bus dispatcher."""
+        SimplePlugin.subscribe(self)
+        self.bus.dispatcher = self
+
+    def unsubscribe(self):
+        """Unregister this object as a listener and as the bus dispatcher."""
+        SimplePlugin.unsubscribe(self)
+        if self.bus.dispatcher is self:
+            self.bus.dispatcher = None
+
+    def __len__(self):
+        return sum([len(shard) for shard in self.shards])
+
+    @property
+    def depths(self):
+        """A list of the number of events waiting in each shard."""
+        return [len(shard) for shard in self.shards]
+
+    @property
+    def queued(self):
+        """The number of events queued so far."""
+        return sum([shard.queued for shard in self.shards])
+
+    @property
+    def dropped(self):
+        """The number of events dropped so far because a queue was full."""
+        return sum([shard.dropped for shard in self.shards])
+
+    @property
+    def dispatched(self):
+        """The number of events published so far."""
+        return sum([shard.dispatched for shard in self.shards])
+
+    def put(self, channel, args=(), kwargs=None, key=None):
+        """Queue an event. Return False if it was dropped, else True."""
+        if kwargs is None:
+            kwargs = {}
+        if key is None:
+            shard = next(self._round_robin)
+        else:
+            shard = self.shards[hash(key) % len(self.shards)]
+        return shard.put((channel, args, kwargs))
+
+    def START(self):
+        """Start the dispatcher threads."""
+        if not self.running:
+            for shard in self.shards:
+                shard.start()
+            self.running = True
+            self.bus.log('Started dispatcher %r.' % self.name)
+    # Start before the servers which might post events.
+    START.priority = 70
+
+    def STOP(self):
+        """Drain the queues, then stop the dispatcher threads."""
+        if self.running:
+            for shard in self.shards:
+                shard.stop()
+            self.running = False
+            self.bus.log('Stopped dispatcher %r.' % self.name)
+    # Stop after the listeners which might post events.
+    STOP.priority = 90
+
+
+class ScheduledJob:
+    """A function which a :class:`Scheduler` runs at a fixed rate."""
+
+    runs = 0
+    """The number of times the function has run."""
+
+    failures = 0
+    """The number of runs which raised an exception."""
+
+    overruns = 0
+    """The number of runs which took longer than the interval."""
+
+    skipped = 0
+    """The number of runs skipped because the previous one was unfinished."""
+
+    last_duration = None
+    """The time in seconds which the last run took."""
+
+    def __init__(self, function, interval, args=(), kwargs=None, name=None,
+                 jitter=0):
+        self.function = function
+        self.interval = interval
+        self.args = args
+        self.kwargs = kwargs or {}
+        self.name = name or getattr(function, '__name__', repr(function))
+        self.jitter = jitter
+        self.due = None
+        self.running = False
+        self.cancelled = False
+
+    def __repr__(self):
+        return '<%s %r every %ss>' % (
+            self.__class__.__name__, self.name, self.interval)
+
+    def cancel(self):
+        """Stop running the function. A run in progress is not interrupted."""
+        self.cancelled = True
+
+
+class Scheduler(SimplePlugin):
+    """Bus plugin which runs many periodic jobs from a few threads.
+
+    A single timer thread keeps a heap of due times, and hands each due
+    job to a pool of at most ``workers`` threads; both exist between the
+    START and STOP states. Jobs may be scheduled at any time::
+
+        scheduler = Scheduler(bus)
+        scheduler.subscribe()
+        job = scheduler.schedule(flush_stats, 10)
+        ...
+        job.cancel()
+
+    Each job runs at a fixed rate (see :func:`_next_run`), except that
+    each run is delayed by a random fraction (at most ``jitter``) of its
+    interval, so that jobs which share an interval do not all run at once.
+    A job never runs concurrently with itself: if a run is still going
+    when the next is due, the new run is skipped (and counted in
+    ``job.skipped``). A run which takes longer than the interval is
+    logged as an overrun. Errors in a job are logged, and the job keeps
+    running.
+    """
+
+    def __init__(self, bus, workers=4, jitter=0.1, name=None):
+        SimplePlugin.__init__(self, bus)
+        self.workers = workers
+        self.jitter = jitter
+        self.name = name or self.__class__.__name__
+        self.heap = []
+        self.mutex = threading.Lock()
+        self.wakeup = threading.Condition(self.mutex)
+        self._sequence = itertools.count()
+        self._worker = threading.local()
+        self.thread = None
+        self.pool = None
+        self.stopping = False
+        self.running = False
+
+    def __len__(self):
+        """Return the number of scheduled (not cancelled) jobs."""
+        return len([job for _, _, job in self.heap if not job.cancelled])
+
+    def schedule(self, function, interval, args=(), kwargs=None, name=None,
+                 jitter=None):
+        """Run function(*args, **kwargs) every interval seconds.
+
+        Return a :class:`ScheduledJob`; call its cancel() method to stop it.
+        """
+        if interval <= 0:
+            raise ValueError('interval must be positive, not %r.' % interval)
+        if jitter is None:
+            jitter = self.jitter
+        job = ScheduledJob(function, interval, args, kwargs, name, jitter)
+        with self.mutex:
+            job.due = time.monotonic() + interval
+            self._push(job)
+            self.wakeup.notify()
+        return job
+
+    def _push(self, job):
+        """Add the job to the heap at its due time, plus any jitter."""
+        when = job.due + random.random() * job.jitter * job.interval
+        heapq.heappush(self.heap, (when, next(self._sequence), job))
+
+    def _next_job(self):
+        """Wait for, and return, the next due job; or None when stopping."""
+        while True:
+            skipped = None
+            with self.mutex:
+                while not self.stopping:
+                    if not self.heap:
+                        self.wakeup.wait()
+                        continue
+                    delay = self.heap[0][0] - time.monotonic()
+                    if delay > 0:
+                        self.wakeup.wait(delay)
+                        continue
+
+                    job = heapq.heappop(self.heap)[2]
+                    if job.cancelled:
+                        continue
+                    job.due = _next_run(job.due, job.interval)
+                    self._push(job)
+                    if job.running:
+                        job.skipped += 1
+                        skipped = job
+                        break
+                    job.running = True
+                    return job
+            if skipped is None:
+                return None
+            # Log without the mutex: 'log' listeners may be slow, or
+            # schedule jobs themselves.
+            self.bus.log('Skipped a run of job %r, since its last run '
+                         'is unfinished.' % skipped.name, level=30)
+
+    def run(self):
+        """Hand due jobs to the worker pool until stopped."""
+        while True:
+            job = self._next_job()
+            if job is None:
+                return
+            self.pool.submit(self._run_job, job)
+
+    def _run_job(self, job):
+        """Run the given job (in a worker thread) and record how it went."""
+        self._worker.active = True
+        started = time.monotonic()
+        try:
+            job.function(*job.args, **job.kwargs)
+        except Exception:
+            job.failures += 1
+            self.bus.log('Error in scheduled job %r.' % job.name,
+                         level=40, traceback=True)
+        finally:
+            job.last_duration = duration = time.monotonic() - started
+            job.runs += 1
+            job.running = False
+        if duration > job.interval:
+            job.overruns += 1
+            self.bus.log('Scheduled job %r overran its %ss interval '
+                         '(took %.3fs).' % (job.name, job.interval, duration),
+                         level=30)
+
+    def START(self):
+        """Start the timer thread and the worker pool."""
+        if not self.running:
+            with self.mutex:
+                # Resume any jobs left over from a previous run afresh.
+                now = time.monotonic()
+                jobs = [job for _, _, job in self.heap if not job.cancelled]
+                del self.heap[:]
+                for job in jobs:
+                    job.due = now + job.interval
+                    self._push(job)
+                self.stopping = False
+            self.pool = ThreadPoolExecutor(
+                self.workers, thread_name_prefix=self.name + '-worker')
+            self.thread = threading.Thread(target=self.run, name=self.name)
+            self.thread.daemon = True
+            self.thread.start()
+            self.running = True
+            self.bus.log('Started scheduler %r.' % self.name)
+    START.priority = 70
+
+    def STOP(self):
+        """Stop the timer thread, and wait for running jobs to finish."""
+        if self.running:
+            with self.mutex:
+                self.stopping = True
+                self.wakeup.notify()
+            self.thread.join()
+            self.thread = None
+            # A job which stops the bus (e.g. to restart) must not wait
+            # for itself to finish.
+            self.pool.shutdown(wait=not getattr(self._worker, 'active', False))
+            self.pool = None
+            self.running = False
+            self.bus.log('Stopped scheduler %r.' % self.name)
+    # Stop after the monitors which might cancel their jobs.
+    STOP.priority = 90
 
 
 class ThreadManager(SimplePlugin):
@@ -265,35 +1089,281 @@ class ThreadManager(SimplePlugin):
 
     def __init__(self, bus):
         self.threads = {}
+        # The current thread's (generation, index), once acquired.
+        self._local = threading.local()
+        # Guards threads and the index allocator below.
+        self._lock = threading.Lock()
+        # A heap of released indexes, which are reused lowest first.
+        self._free = []
+        self._size = 0
+        # Incremented by STOP, which forgets all acquired threads at once.
+        self._generation = 0
         SimplePlugin.__init__(self, bus)
         self.bus.listeners.setdefault('acquire_thread', set())
         self.bus.listeners.setdefault('start_thread', set())
         self.bus.listeners.setdefault('release_thread', set())
         self.bus.listeners.setdefault('stop_thread', set())
 
+    @property
+    def size(self):
+        """The highest index handed out since creation or the last STOP.
+
+        Released indexes are reused before new ones are handed out, so
+        the index of every acquired thread is between 1 and size, and
+        size never exceeds the most threads acquired at once. Per-thread
+        data can therefore be kept in a list, indexed by thread index.
+        """
+        return self._size
+
+    def index(self):
+        """Return the index of the current thread, or None if not acquired."""
+        state = getattr(self._local, 'state', None)
+        if state is not None and state[0] == self._generation:
+            return state[1]
+        return None
+
     def acquire_thread(self):
         """Run 'start_thread' listeners for the current thread.
 
         If the current thread has already been seen, any 'start_thread'
         listeners will not be run again.
         """
+        state = getattr(self._local, 'state', None)
+        if state is not None and state[0] == self._generation:
+            return
+
         thread_ident = threading.get_ident()
-        if thread_ident not in self.threads:
-            # We can't just use get_ident as the thread ID
-            # because some platforms reuse thread ID's.
-            i = len(self.threads) + 1
-            self.threads[thread_ident] = i
-            self.bus.publish('start_thread', i)
+        with self._lock:
+            i = self.threads.get(thread_ident)
+            new = i is None
+            if new:
+                # We can't just use get_ident as the thread ID
+                # because some platforms reuse thread ID's.
+                if self._free:
+                    i = heapq.heappop(self._free)
+                else:
+                    self._size += 1
+                    i = self._size
+                self.threads[thread_ident] = i
+            self._local.state = (self._generation, i)
+        if new:
+            self.bus.publish_sync('start_thread', i)
 
     def release_thread(self):
         """Release the current thread and run 'stop_thread' listeners."""
         thread_ident = threading.get_ident()
-        i = self.threads.pop(thread_ident, None)
+        with self._lock:
+            i = self.threads.pop(thread_ident, None)
+            generation = self._generation
+            self._local.state = None
         if i is not None:
-            self.bus.publish('stop_thread', i)
+            self.bus.publish_sync('stop_thread', i)
+            # Only reuse the index once its listeners are done with it.
+            with self._lock:
+                if generation == self._generation:
+                    heapq.heappush(self._free, i)
 
     def STOP(self):
         """Release all threads and run all 'stop_thread' listeners."""
-        for thread_ident, i in self.threads.items():
-            self.bus.publish('stop_thread', i)
-        self.threads.clear()
+        with self._lock:
+            indexes = sorted(self.threads.values())
+            self.threads.clear()
+            self._free = []
+            self._size = 0
+            self._generation += 1
+        for i in indexes:
+            self.bus.publish_sync('stop_thread', i)
+
+
+class ThreadResourcePool(SimplePlugin):
+    """Bus plugin which keeps one resource (a connection, say) per thread.
+
+    Threads are numbered by the given :class:`ThreadManager`. The first
+    time a thread calls :meth:`get`, a resource is made by calling
+    ``factory()``; after that, get() returns the same resource from a list
+    indexed by thread index. Resources are closed, by calling
+    ``close(resource)`` (or resource.close(), by default), when their thread
+    publishes to 'release_thread', and on STOP::
+
+        pool = ThreadResourcePool(bus, thread_manager, connect, maxsize=50)
+        pool.subscribe()
+        ...
+        pool.get().execute(query)
+
+    If a ``check`` function is given, a :class:`Monitor` (which may use a
+    :class:`Scheduler`) calls it every ``check_interval`` seconds with each
+    resource which was not used since the previous check. Resources for
+    which it returns false (or raises) are closed, and their threads get
+    new ones. A resource is taken out of its slot while it is checked, so
+    it is never used and checked at once; it still counts towards
+    ``maxsize`` meanwhile.
+
+    If ``maxsize`` is given, get() raises RuntimeError rather than make
+    more than that many resources at once.
+    """
+
+    def __init__(self, bus, thread_manager, factory, close=None, check=None,
+                 maxsize=None, check_interval=60, scheduler=None, name=None):
+        SimplePlugin.__init__(self, bus)
+        self.thread_manager = thread_manager
+        self.factory = factory
+        self._close = close
+        self.check = check
+        self.maxsize = maxsize
+        self.name = name or self.__class__.__name__
+        # Resources and the times they were last got, by thread index.
+        self.resources = []
+        self.last_used = []
+        self.count = 0
+        self.lock = threading.Lock()
+        # Set while STOP runs; the generation counts finished STOPs.
+        self._stopping = False
+        self._generation = 0
+        self._last_check = time.monotonic()
+        self.monitor = None
+        if check is not None:
+            self.monitor = Monitor(bus, self.check_idle, check_interval,
+                                   name='%s health check' % self.name,
+                                   scheduler=scheduler)
+
+    def subscribe(self):
+        SimplePlugin.subscribe(self)
+        if self.monitor is not None:
+            self.monitor.subscribe()
+
+    def unsubscribe(self):
+        SimplePlugin.unsubscribe(self)
+        if self.monitor is not None:
+            self.monitor.unsubscribe()
+
+    def __len__(self):
+        return self.count
+
+    def _grow(self, i):
+        """Make room for thread index i (the lock must be held)."""
+        if i >= len(self.resources):
+            extra = i + 1 - len(self.resources)
+            self.resources.extend([None] * extra)
+            self.last_used.extend([0] * extra)
+
+    def get(self):
+        """Return the resource of the current thread, making it if needed."""
+        i = self.thread_manager.index()
+        if i is None:
+            self.bus.publish_sync('acquire_thread')
+            i = self.thread_manager.index()
+            if i is None:
+                raise RuntimeError(
+                    '%s could not number this thread; is its ThreadManager '
+                    'subscribed to the bus?' % self.name)
+        try:
+            resource = self.resources[i]
+        except IndexError:
+            resource = None
+        if resource is not None:
+            self.last_used[i] = time.monotonic()
+            return resource
+
+        with self.lock:
+            if self.maxsize is not None and self.count >= self.maxsize:
+                raise RuntimeError('%s is full (maxsize=%d).' %
+                                   (self.name, self.maxsize))
+            self.count += 1
+        try:
+            resource = self.factory()
+        except BaseException:
+            with self.lock:
+                self.count -= 1
+            raise
+        with self.lock:
+            self._grow(i)
+            self.resources[i] = resource
+            self.last_used[i] = time.monotonic()
+        return resource
+
+    def close(self, resource):
+        """Close the given resource, logging any error."""
+        try:
+            if self._close is not None:
+                self._close(resource)
+            else:
+                close = getattr(resource, 'close', None)
+                if close is not None:
+                    close()
+        except Exception:
+            self.bus.log('Error closing %r.' % (resource,),
+                         level=40, traceback=True)
+
+    def _take(self, i):
+        """Remove and return the resource at index i, if any."""
+        with self.lock:
+            if i >= len(self.resources):
+                return None
+            resource = self.resources[i]
+            if resource is not None:
+                self.resources[i] = None
+                self.count -= 1
+            return resource
+
+    def start_thread(self, i):
+        """Make room for the new thread; its resource is made by get()."""
+        with self.lock:
+            self._grow(i)
+
+    def stop_thread(self, i):
+        """Close the resource of the given thread index, if any."""
+        resource = self._take(i)
+        if resource is not None:
+            self.close(resource)
+
+    def STOP(self):
+        """Close all resources."""
+        with self.lock:
+            self._stopping = True
+        try:
+            for i in range(len(self.resources)):
+                self.stop_thread(i)
+        finally:
+            with self.lock:
+                self._stopping = False
+                self._generation += 1
+    # Run after ThreadManager.STOP has published 'stop_thread'.
+    STOP.priority = 60
+
+    def check_idle(self):
+        """Check the resources not used since the last check.
+
+        Close those which fail; put the rest back, unless their thread
+        has made a new resource meanwhile or STOP has closed the others.
+        """
+        checked = self._last_check
+        self._last_check = time.monotonic()
+        for i in range(len(self.resources)):
+            if self.last_used[i] >= checked:
+                continue
+            # Keep the resource counted while it is checked, so its
+            # thread cannot make a new one past maxsize meanwhile.
+            with self.lock:
+                resource = self.resources[i]
+                if resource is None:
+                    continue
+                self.resources[i] = None
+                generation = self._generation
+            try:
+                healthy = self.check(resource)
+            except Exception:
+                self.bus.log('Error checking %r.' % (resource,),
+                             level=30, traceback=True)
+                healthy = False
+            with self.lock:
+                if (
+                    healthy and self.resources[i] is None and
+                    # STOP, which closes all resources, has not run since.
+                    not self._stopping and self._generation == generation
+                ):
+                    self.resources[i] = resource
+                    continue
+                self.count -= 1
+            if not healthy:
+                self.bus.log('Closing unhealthy %r.' % (resource,), level=30)
+            self.close(resource)
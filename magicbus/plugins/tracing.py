@@ -0,0 +1,123 @@
+"""Timeline tracing of bus transitions and listeners.
+
+The :class:`Tracer` plugin records every state transition, every listener
+call and every 'log' message, with monotonic timestamps and thread ids,
+into a bounded in-memory ring buffer. The buffer can be exported as
+`Chrome trace-event JSON
+<https://docs.google.com/document/d/1CvAClvFfyA5R-PhYUmn5OOQtYMH4h6I0nSsKchNAySU>`_,
+which chrome://tracing and https://ui.perfetto.dev can display::
+
+    tracer = Tracer(bus)
+    tracer.subscribe()
+    bus.transition('RUN')
+    bus.transition('EXITED')
+    tracer.dump('boot.json')
+"""
+
+import collections
+import json
+import os
+import threading
+import time
+
+from magicbus.base import BusHook
+
+
+class Tracer(BusHook):
+    """Bus plugin which records a timeline of bus activity."""
+
+    capacity = 100000
+    """The maximum number of events to keep; older ones are discarded."""
+
+    def __init__(self, bus, capacity=None):
+        self.bus = bus
+        if capacity is not None:
+            self.capacity = capacity
+        self.events = collections.deque(maxlen=self.capacity)
+        self.thread_names = {}
+        self.pid = os.getpid()
+
+    def subscribe(self):
+        self.bus.add_hook(self)
+        self.bus.subscribe('log', self.log)
+
+    def unsubscribe(self):
+        self.bus.remove_hook(self)
+        self.bus.unsubscribe('log', self.log)
+
+    def clear(self):
+        """Discard all recorded events."""
+        self.events.clear()
+
+    def _thread(self):
+        """Return the id of the current thread, remembering its name."""
+        tid = threading.get_native_id()
+        if tid not in self.thread_names:
+            self.thread_names[tid] = threading.current_thread().name
+        return tid
+
+    def _complete(self, name, category, duration, args):
+        """Record a complete event which ended just now."""
+        end = time.perf_counter()
+        self.events.append({
+            'name': name,
+            'cat': category,
+            'ph': 'X',
+            'ts': (end - duration) * 1e6,
+            'dur': duration * 1e6,
+            'pid': self.pid,
+            'tid': self._thread(),
+            'args': args,
+        })
+
+    def after_publish(self, channel, listener, duration, exc):
+        if channel == 'log':
+            # Log messages are recorded as instant events instead.
+            return
+        # States and channels may be any (hashable) objects; keep the
+        # trace JSON serializable.
+        args = {'channel': str(channel)}
+        if exc is not None:
+            args['error'] = repr(exc)
+        self._complete(
+            getattr(listener, '__qualname__', None) or repr(listener),
+            'listener', duration, args)
+
+    def after_transition(self, state, newstate, duration, exc):
+        args = {'from': str(state), 'to': str(newstate)}
+        if exc is not None:
+            args['error'] = repr(exc)
+        self._complete('%s -> %s' % (state, newstate), 'transition',
+                       duration, args)
+
+    def log(self, msg, level):
+        self.events.append({
+            'name': msg.split('\n', 1)[0],
+            'cat': 'log',
+            'ph': 'i',
+            's': 't',
+            'ts': time.perf_counter() * 1e6,
+            'pid': self.pid,
+            'tid': self._thread(),
+            'args': {'message': msg, 'level': level},
+        })
+
+    def to_chrome_trace(self):
+        """Return the recorded events as a Chrome trace-event dict."""
+        events = [
+            {
+                'name': 'thread_name', 'ph': 'M',
+                'pid': self.pid, 'tid': tid, 'args': {'name': name},
+            }
+            for tid, name in list(self.thread_names.items())
+        ]
+        events.extend(list(self.events))
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def dump(self, file):
+        """Write the Chrome trace JSON to the given filename or file."""
+        if isinstance(file, (str, bytes, os.PathLike)):
+            with open(file, 'w') as f:
+                json.dump(self.to_chrome_trace(), f)
+        else:
+            json.dump(self.to_chrome_trace(), file)
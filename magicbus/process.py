@@ -2,7 +2,81 @@ import os
 import threading
 
 from magicbus import base
-from magicbus.plugins import lifecycle
+
+# Transitions from k -> v. Note that this does *not*
+# include any transitions triggered by errors;
+# those are in the "error" dict below so that
+# 1) try/except blocks can take error transitions but also
+# 2) transition() will *not* take error transitions.
+# However, we *do* include transitions *away from* error states.
+edges = {
+    'INITIAL': 'ENTER',
+    'ENTER': 'IDLE',
+    'START': ('RUN', 'STOP'),
+    'RUN': 'STOP',
+    'START_ERROR': 'STOP',
+    'STOP': 'IDLE',
+    'IDLE': ('START', 'EXIT'),
+    'STOP_ERROR': 'EXIT',
+    'EXIT': 'EXITED',
+    'EXIT_ERROR': 'EXITED',
+}
+
+# The shortest paths through the edges above, precomputed so that
+# creating a ProcessBus need not search them; this must always equal
+# Graph.from_edges(edges). Each entry is {from: {next: (to, ...)}}.
+transitions = base.Graph(
+    ((source, target), hop)
+    for source, hops in {
+        'INITIAL': {
+            'ENTER': ('ENTER', 'IDLE', 'START', 'RUN', 'STOP', 'EXIT',
+                      'EXITED'),
+        },
+        'ENTER': {
+            'IDLE': ('IDLE', 'START', 'RUN', 'STOP', 'EXIT', 'EXITED'),
+        },
+        'IDLE': {
+            'START': ('START', 'RUN', 'STOP'),
+            'EXIT': ('EXIT', 'EXITED'),
+        },
+        'START': {
+            'RUN': ('RUN',),
+            'STOP': ('STOP', 'IDLE', 'EXIT', 'EXITED'),
+        },
+        'RUN': {
+            'STOP': ('STOP', 'IDLE', 'START', 'EXIT', 'EXITED'),
+        },
+        'START_ERROR': {
+            'STOP': ('STOP', 'IDLE', 'START', 'RUN', 'EXIT', 'EXITED'),
+        },
+        'STOP': {
+            'IDLE': ('IDLE', 'START', 'RUN', 'EXIT', 'EXITED'),
+        },
+        'STOP_ERROR': {
+            'EXIT': ('EXIT', 'EXITED'),
+        },
+        'EXIT': {
+            'EXITED': ('EXITED',),
+        },
+        'EXIT_ERROR': {
+            'EXITED': ('EXITED',),
+        },
+    }.items()
+    for hop, targets in hops.items()
+    for target in targets
+)
+
+# A dict whose keys are states. Exceptions raised during
+# the execution of those states move the machine to the
+# state named by the corresponding value.
+errors = {
+    'ENTER': 'STOP_ERROR',
+    'START': 'START_ERROR',
+    'RUN': 'START_ERROR',
+    'STOP': 'STOP_ERROR',
+    'IDLE': 'STOP_ERROR',
+    'EXIT': 'EXIT_ERROR',
+}
 
 
 class ProcessBus(base.Bus):
@@ -56,35 +130,8 @@ class ProcessBus(base.Bus):
     def __init__(self):
         base.Bus.__init__(
             self,
-            # Transitions from k -> v. Note that this does *not*
-            # include any transitions triggered by errors;
-            # those are in the "error" dict below so that
-            # 1) try/except blocks can take error transitions but also
-            # 2) transition() will *not* take error transitions.
-            # However, we *do* include transitions *away from* error states.
-            transitions={
-                'INITIAL': 'ENTER',
-                'ENTER': 'IDLE',
-                'START': ('RUN', 'STOP'),
-                'RUN': 'STOP',
-                'START_ERROR': 'STOP',
-                'STOP': 'IDLE',
-                'IDLE': ('START', 'EXIT'),
-                'STOP_ERROR': 'EXIT',
-                'EXIT': 'EXITED',
-                'EXIT_ERROR': 'EXITED',
-            },
-            # A dict whose keys are states. Exceptions raised during
-            # the execution of those states move the machine to the
-            # state named by the corresponding value.
-            errors={
-                'ENTER': 'STOP_ERROR',
-                'START': 'START_ERROR',
-                'RUN': 'START_ERROR',
-                'STOP': 'STOP_ERROR',
-                'IDLE': 'STOP_ERROR',
-                'EXIT': 'EXIT_ERROR'
-            },
+            transitions=transitions,
+            errors=dict(errors),
             initial_state='INITIAL',
             extra_channels=('log', 'main', 'execv')
         )
@@ -93,6 +140,7 @@ class ProcessBus(base.Bus):
         self.subscribe('STOP_ERROR', self.STOP_ERROR)
         self.subscribe('EXIT_ERROR', self.EXIT_ERROR)
 
+        from magicbus.plugins import lifecycle
         self.thread_wait = lifecycle.ThreadWait(self)
         self.thread_wait.subscribe()
         self.clean_exit = lifecycle.CleanExit(self)
@@ -60,6 +60,7 @@ class Process:
             self.process.kill()
         if self._pty_stdin is not None:
             os.close(self._pty_stdin)
+            self._pty_stdin = None
 
     def join(self):
         return self.process.wait()
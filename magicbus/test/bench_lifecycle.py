@@ -0,0 +1,229 @@
+"""End-to-end latency benchmarks for ProcessBus subprocesses.
+
+Each iteration spawns a real ProcessBus process which serves HTTP through
+a :class:`ServerPlugin <magicbus.plugins.servers.ServerPlugin>`, and then
+measures, from the outside:
+
+    * boot: from spawning the process to its first served request
+    * graceful: from SIGUSR1 until a request is served by the restarted
+      server (see :meth:`ProcessBus.graceful`)
+    * restart: from SIGUSR2 until a request is served by the re-executed
+      process (see :meth:`ProcessBus.restart`)
+    * sigterm: from SIGTERM until the process has exited
+
+Run it with::
+
+    python -m magicbus.test.bench_lifecycle -n 50
+
+Pass ``--json`` for machine-readable output. This harness requires POSIX
+signals.
+"""
+
+import argparse
+import json
+import os
+import signal
+import socket
+import sys
+import time
+from http.client import HTTPConnection
+
+from magicbus.test import Process, WebHandler, WebServer, WebService
+
+thismodule = os.path.abspath(__file__)
+
+phases = ('boot', 'graceful', 'restart', 'sigterm')
+
+
+# ---------------------------- Child process ---------------------------- #
+
+class Service(WebService):
+    """A WebService whose stop() blocks until its socket is closed."""
+
+    generation = 0
+    """The number of times the service has started in this process."""
+
+    poll_interval = 0.01
+
+    def start(self):
+        httpd = self.httpd = WebServer(self.address, self.handler_class)
+        Service.generation += 1
+        self.ready = True
+        try:
+            httpd.serve_forever(self.poll_interval)
+        finally:
+            httpd.server_close()
+
+    def stop(self):
+        if self.httpd is not None:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+        self.httpd = None
+        self.ready = False
+
+
+class Handler(WebHandler):
+
+    boot_id = '%d.%d' % (os.getpid(), time.monotonic_ns())
+    """Distinguishes this process image from the one before execv."""
+
+    def do_GET(self):
+        self.respond('%s %d %s' % (
+            self.boot_id, Service.generation, self.bus.state))
+
+    def log_message(self, format, *args):
+        # The parent closes its end of our terminal; don't write to it.
+        pass
+
+
+def child(port, logfile=None):
+    """Serve on the given port until told to exit."""
+    from magicbus.plugins import loggers, servers, signalhandler
+    from magicbus.process import ProcessBus
+
+    bus = ProcessBus()
+    if logfile:
+        loggers.FileLogger(bus, logfile).subscribe()
+    Handler.bus = bus
+    service = Service(('127.0.0.1', int(port)), Handler)
+    servers.ServerPlugin(bus, service, service.address).subscribe()
+    handler = signalhandler.SignalHandler(bus)
+    handler.handlers['SIGUSR2'] = bus.restart
+    handler.subscribe()
+    bus.transition('RUN')
+    bus.block()
+
+
+# ---------------------------- Parent process ---------------------------- #
+
+def free_port():
+    """Return a TCP port on 127.0.0.1 which nothing is listening on."""
+    s = socket.socket()
+    try:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+    finally:
+        s.close()
+
+
+def poll(port, until, timeout=30, interval=0.002):
+    """GET / until the bus is in RUN and until(boot_id, generation).
+
+    Return (boot_id, generation) from the matching response.
+    """
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        conn = HTTPConnection('127.0.0.1', port, timeout=1)
+        try:
+            conn.request('GET', '/')
+            boot_id, generation, state = (
+                conn.getresponse().read().decode().split())
+        except (OSError, ValueError):
+            pass
+        else:
+            # A server may answer before its START listener returns;
+            # the process is not up until the bus has reached RUN.
+            if state == 'RUN' and until(boot_id, int(generation)):
+                return boot_id, int(generation)
+        finally:
+            conn.close()
+        time.sleep(interval)
+    raise RuntimeError('Timed out waiting for the server on port %d' % port)
+
+
+def iteration(logfile=None, timeout=30):
+    """Run one process through all phases; return {phase: seconds}."""
+    port = free_port()
+    proc = Process([sys.executable, thismodule, 'child', str(port),
+                    logfile or ''])
+    result = {}
+    started = time.perf_counter()
+    proc.start()
+    try:
+        boot_id, generation = poll(port, lambda b, g: True, timeout)
+        result['boot'] = time.perf_counter() - started
+        pid = proc.process.pid
+
+        started = time.perf_counter()
+        os.kill(pid, signal.SIGUSR1)
+        boot_id, generation = poll(
+            port, lambda b, g: b == boot_id and g > generation, timeout)
+        result['graceful'] = time.perf_counter() - started
+
+        started = time.perf_counter()
+        os.kill(pid, signal.SIGUSR2)
+        poll(port, lambda b, g: b != boot_id, timeout)
+        result['restart'] = time.perf_counter() - started
+
+        started = time.perf_counter()
+        os.kill(pid, signal.SIGTERM)
+        proc.process.wait(timeout)
+        result['sigterm'] = time.perf_counter() - started
+    finally:
+        proc.stop()
+    return result
+
+
+def summarize(samples):
+    """Return count, mean, stdev, min, p50, p90, p99 and max of samples."""
+    ordered = sorted(samples)
+    n = len(ordered)
+
+    def percentile(p):
+        return ordered[max(0, -(-n * p // 100) - 1)]
+
+    mean = sum(ordered) / n
+    return {
+        'count': n,
+        'mean': mean,
+        'stdev': (sum((x - mean) ** 2 for x in ordered) / n) ** 0.5,
+        'min': ordered[0],
+        'p50': percentile(50),
+        'p90': percentile(90),
+        'p99': percentile(99),
+        'max': ordered[-1],
+    }
+
+
+def run(iterations=20, logfile=None, timeout=30):
+    """Return {phase: summary} over the given number of iterations."""
+    samples = dict((phase, []) for phase in phases)
+    for _ in range(iterations):
+        for phase, seconds in iteration(logfile, timeout).items():
+            samples[phase].append(seconds)
+    return dict((phase, summarize(s)) for phase, s in samples.items())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m magicbus.test.bench_lifecycle',
+        description=__doc__.split('\n')[0])
+    parser.add_argument('-n', '--iterations', type=int, default=20,
+                        help='processes to run (default 20)')
+    parser.add_argument('--timeout', type=float, default=30,
+                        help='seconds to wait for each phase (default 30)')
+    parser.add_argument('--log', help='file for the child bus logs')
+    parser.add_argument('--json', action='store_true',
+                        help='write results as JSON')
+    args = parser.parse_args(argv)
+
+    results = run(args.iterations, args.log, args.timeout)
+    if args.json:
+        json.dump(results, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write('\n')
+    else:
+        sys.stdout.write('%-9s %5s %9s %9s %9s %9s %9s  (ms)\n' % (
+            'phase', 'n', 'min', 'p50', 'p90', 'p99', 'max'))
+        for phase in phases:
+            s = results[phase]
+            sys.stdout.write('%-9s %5d %9.1f %9.1f %9.1f %9.1f %9.1f\n' % (
+                phase, s['count'], s['min'] * 1e3, s['p50'] * 1e3,
+                s['p90'] * 1e3, s['p99'] * 1e3, s['max'] * 1e3))
+    return 0
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['child']:
+        child(*sys.argv[2:])
+    else:
+        sys.exit(main())
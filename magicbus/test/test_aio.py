@@ -0,0 +1,236 @@
+import asyncio
+import os
+import signal
+import threading
+import time
+import warnings
+
+import pytest
+
+from magicbus.aio import AsyncBus, AsyncProcessBus
+from magicbus.base import ChannelFailures
+from magicbus.plugins.signalhandler import SignalHandler
+from magicbus.plugins.tasks import Dispatcher, ThreadManager
+from magicbus.process import ProcessBus
+
+
+def test_same_priority_listeners_run_concurrently():
+    b = AsyncBus()
+    events = []
+
+    def make_listener(name, delay):
+        async def listener():
+            events.append(('start', name))
+            await asyncio.sleep(delay)
+            events.append(('end', name))
+            return name
+        return listener
+
+    b.subscribe('hugh', make_listener('slow', 0.3), priority=10)
+    b.subscribe('hugh', make_listener('fast', 0.2), priority=10)
+    b.subscribe('hugh', lambda: 'sync', priority=10)
+    b.subscribe('hugh', make_listener('last', 0), priority=20)
+
+    started = time.monotonic()
+    output = asyncio.run(b.publish('hugh'))
+    elapsed = time.monotonic() - started
+
+    # The first band runs concurrently: about as long as its slowest member.
+    assert elapsed < 0.45
+    assert sorted(output[:3]) == ['fast', 'slow', 'sync']
+    assert output[3] == 'last'
+    # The second band only starts once the first has finished.
+    assert events[-2:] == [('start', 'last'), ('end', 'last')]
+
+
+def test_listener_failures_collected():
+    b = AsyncBus()
+
+    async def fail():
+        raise ValueError('boom')
+
+    async def ok():
+        return 'ok'
+
+    b.subscribe('hugh', fail)
+    b.subscribe('hugh', ok)
+    b.subscribe('hugh', lambda: 1 / 0)
+
+    with pytest.raises(ChannelFailures) as exc_info:
+        asyncio.run(b.publish('hugh'))
+
+    assert sorted(type(e).__name__
+                  for e in exc_info.value.get_instances()) == [
+        'ValueError', 'ZeroDivisionError',
+    ]
+
+
+def test_process_bus_transitions():
+    b = AsyncProcessBus()
+    log = []
+    b.subscribe('log', lambda msg, level: log.append(msg))
+
+    async def start():
+        await asyncio.sleep(0)
+        return 'started'
+
+    b.subscribe('START', start)
+
+    async def run():
+        output = await b.transition('RUN')
+        assert b.state == 'RUN'
+        await b.transition('EXITED')
+        return output
+
+    # ENTER runs CleanExit; IDLE and RUN have no listeners.
+    assert asyncio.run(run()) == [[None], [], ['started'], []]
+    assert b.state == 'EXITED'
+    assert 'Bus state: RUN' in log
+
+
+def test_process_bus_error_transition():
+    b = AsyncProcessBus()
+
+    async def start():
+        raise ValueError('boom')
+
+    b.subscribe('START', start)
+
+    asyncio.run(b.transition('RUN'))
+    # The START_ERROR listener awaits a transition to EXITED.
+    assert b.state == 'EXITED'
+
+
+def test_wait_async():
+    b = ProcessBus()
+
+    async def run():
+        assert await b.wait_async('RUN', timeout=0.1) is None
+
+        loop = asyncio.get_running_loop()
+        waiter = asyncio.ensure_future(b.wait_async(['RUN', 'EXITED']))
+        await asyncio.sleep(0)
+        await loop.run_in_executor(None, b.transition, 'IDLE')
+        assert not waiter.done()
+        await loop.run_in_executor(None, b.transition, 'RUN')
+        assert await asyncio.wait_for(waiter, 5) == 'RUN'
+
+        # A state which was already reached resolves at once.
+        assert await b.wait_async(('IDLE', 'RUN')) == 'RUN'
+
+    try:
+        asyncio.run(run())
+        assert not b._state_waiters
+    finally:
+        b.transition('EXITED')
+
+
+@pytest.mark.skipif(os.name != 'posix', reason='requires POSIX signals')
+def test_signal_handler():
+    b = AsyncProcessBus()
+    handler = SignalHandler(b)
+    handler.subscribe()
+
+    async def run():
+        await b.transition('RUN')
+        # The handler interrupts the running loop; the transition
+        # it starts must be awaited by the loop, not dropped.
+        os.kill(os.getpid(), signal.SIGTERM)
+        return await b.wait_async('EXITED', timeout=5)
+
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter('error', RuntimeWarning)
+            assert asyncio.run(run()) == 'EXITED'
+    finally:
+        handler.unsubscribe()
+
+
+def in_thread(func, *args):
+    """Return a future for func(*args), called in a new daemon thread."""
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+
+    def run():
+        try:
+            result = func(*args)
+        except BaseException as exc:
+            loop.call_soon_threadsafe(future.set_exception, exc)
+        else:
+            loop.call_soon_threadsafe(future.set_result, result)
+    # Not an executor thread, which ThreadWait would join at EXIT.
+    threading.Thread(target=run, daemon=True).start()
+    return future
+
+
+def test_wait_and_threads():
+    b = AsyncProcessBus()
+    tm = ThreadManager(b)
+    tm.subscribe()
+    started = []
+    b.subscribe('start_thread', started.append)
+    mains = []
+    b.subscribe('main', lambda: mains.append(b.state))
+
+    async def run():
+        # Blocking the loop thread would deadlock.
+        with pytest.raises(RuntimeError):
+            b.wait('RUN')
+
+        await b.transition('IDLE')
+        waiter = in_thread(b.wait, 'RUN', 0.01, 'main')
+        await asyncio.sleep(0.05)
+        await b.transition('RUN')
+        assert await asyncio.wait_for(waiter, 5) == 'RUN'
+        assert mains
+
+        # Listeners which must run in the publishing thread.
+        await in_thread(b.publish_sync, 'acquire_thread')
+        assert started == [1]
+
+        async def nope():
+            pass
+        b.subscribe('hugh', nope)
+        with pytest.raises(TypeError):
+            b.publish_sync('hugh')
+
+        # Other threads hand calls to the loop.
+        future = await in_thread(b.call_threadsafe, b.transition, 'EXITED')
+        await asyncio.wait_for(asyncio.wrap_future(future), 5)
+        assert b.state == 'EXITED'
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('error', RuntimeWarning)
+        asyncio.run(run())
+
+
+def test_post():
+    b = AsyncProcessBus()
+    received = []
+
+    async def listener(n):
+        await asyncio.sleep(0)
+        received.append(n)
+    b.subscribe('tick', listener)
+
+    async def run():
+        await b.transition('IDLE')
+        # Without a dispatcher, events are scheduled on the loop.
+        with warnings.catch_warnings():
+            warnings.simplefilter('error')
+            assert b.post('tick', 1)
+        await asyncio.sleep(0.05)
+        assert received == [1]
+
+        dispatcher = Dispatcher(b)
+        dispatcher.subscribe()
+        await b.transition('RUN')
+        for n in range(2, 6):
+            assert b.post('tick', n)
+        deadline = time.monotonic() + 5
+        while len(received) < 5 and time.monotonic() < deadline:
+            await asyncio.sleep(0.01)
+        await b.transition('EXITED')
+
+    asyncio.run(run())
+    assert received == [1, 2, 3, 4, 5]
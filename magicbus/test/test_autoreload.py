@@ -0,0 +1,266 @@
+import errno
+import os
+import sys
+import time
+import types
+
+import pytest
+
+from magicbus.plugins import inotify, tasks
+from magicbus.process import ProcessBus
+
+requires_inotify = pytest.mark.skipif(
+    not inotify.available(), reason='inotify is not available')
+
+
+@requires_inotify
+def test_inotify_watcher(tmp_path):
+    watched = tmp_path / 'watched.py'
+    other = tmp_path / 'other.py'
+    watched.write_text('a = 1')
+    other.write_text('b = 1')
+
+    watcher = inotify.InotifyWatcher()
+    try:
+        watcher.watch(str(watched))
+        watcher.watch(str(tmp_path / 'missing.py'))
+        watcher.watch('<frozen something>')
+        assert watcher.changes() == set()
+
+        other.write_text('b = 2')
+        assert watcher.changes() == set()
+
+        watched.write_text('a = 2')
+        assert watcher.changes() == set([str(watched)])
+        assert watcher.changes() == set()
+
+        # Replaced by a rename, as many editors do.
+        replacement = tmp_path / 'watched.py.tmp'
+        replacement.write_text('a = 3')
+        os.rename(str(replacement), str(watched))
+        assert watcher.changes() == set([str(watched)])
+
+        watched.unlink()
+        assert watcher.changes() == set([str(watched)])
+    finally:
+        watcher.close()
+
+
+@pytest.mark.parametrize('backend', [
+    'stat', pytest.param('inotify', marks=requires_inotify)])
+def test_autoreloader(tmp_path, backend):
+    bus = ProcessBus()
+    restarts = []
+    bus.restart = lambda: restarts.append(1)
+    reloader = tasks.Autoreloader(bus, frequency=60, backend=backend,
+                                  match='^$')
+    reloader.max_backoff = 1
+    reloader.debounce = 0
+    f = tmp_path / 'config.py'
+    f.write_text('x = 1')
+    reloader.files.add(str(f))
+
+    reloader.START()
+    try:
+        reloader.run()
+        assert restarts == []
+        st = os.stat(str(f))
+        f.write_text('x = 2')
+        os.utime(str(f), (st.st_atime, st.st_mtime + 10))
+        reloader.run()
+        assert restarts == [1]
+    finally:
+        reloader.STOP()
+    assert reloader.watcher is None
+
+
+@requires_inotify
+def test_autoreloader_inotify_fallback(tmp_path):
+    bus = ProcessBus()
+    restarts = []
+    bus.restart = lambda: restarts.append(1)
+    messages = []
+    bus.subscribe('log', lambda msg, level: messages.append(msg))
+    reloader = tasks.Autoreloader(bus, frequency=60, backend='inotify',
+                                  match='^$')
+    reloader.max_backoff = 1
+    reloader.debounce = 0
+    full = tmp_path / 'full'
+    full.mkdir()
+    polled = full / 'polled.py'
+    watched = tmp_path / 'watched.py'
+    for f in (polled, watched):
+        f.write_text('x = 1')
+        reloader.files.add(str(f))
+
+    reloader.START()
+    add_watch = reloader.watcher.inotify.add_watch
+
+    def no_space(path, mask):
+        if path == str(full):
+            raise OSError(errno.ENOSPC, os.strerror(errno.ENOSPC))
+        return add_watch(path, mask)
+    reloader.watcher.inotify.add_watch = no_space
+    try:
+        reloader.run()
+        assert list(reloader.mtimes) == [str(full)]
+        assert any('Polling %s' % full in m for m in messages)
+        assert restarts == []
+        _touch(polled, 'x = 2')
+        reloader.run()
+        assert restarts == [1]
+        watched.write_text('x = 2')
+        reloader.run()
+        assert restarts == [1, 1]
+    finally:
+        reloader.STOP()
+
+
+def test_inotify_unavailable(monkeypatch):
+    # A C library without inotify_init1.
+    monkeypatch.setattr(inotify, '_libc', None)
+    monkeypatch.setattr(inotify.ctypes, 'CDLL',
+                        lambda *args, **kwargs: types.SimpleNamespace())
+    assert not inotify.available()
+
+
+def test_new_sysfiles(tmp_path):
+    reloader = tasks.Autoreloader(ProcessBus(), match='^autoreload_test_')
+    assert reloader.new_sysfiles() == set()
+    assert reloader.new_sysfiles() == set()
+
+    m = types.ModuleType('autoreload_test_mod')
+    m.__file__ = str(tmp_path / 'autoreload_test_mod.py')
+    sys.modules[m.__name__] = m
+    try:
+        assert reloader.new_sysfiles() == set([m.__file__])
+        assert reloader.new_sysfiles() == set()
+    finally:
+        del sys.modules[m.__name__]
+    assert reloader.new_sysfiles() == set()
+
+
+def test_poll_and_backoff(tmp_path):
+    bus = ProcessBus()
+    restarts = []
+    bus.restart = lambda: restarts.append(1)
+    reloader = tasks.Autoreloader(bus, backend='stat', match='^$')
+    reloader.max_backoff = 4
+    files = [tmp_path / ('f%d.py' % i) for i in range(3)]
+    for f in files:
+        f.write_text('')
+        reloader.files.add(str(f))
+
+    polls = []
+    poll = reloader.poll
+    reloader.poll = lambda: polls.append(1) or poll()
+    for _ in range(12):
+        reloader.run()
+    # Polls at ticks 1, 3, 7 and 11.
+    assert len(polls) == 4
+    assert list(reloader.mtimes) == [str(tmp_path)]
+
+    files[1].unlink()
+    assert reloader.poll() == set([str(files[1])])
+    assert reloader.poll() == set()
+    assert restarts == []
+
+
+def _touch(path, content=None):
+    """Move the mtime of path forward, rewriting it if content is given."""
+    st = os.stat(str(path))
+    if content is not None:
+        path.write_text(content)
+    os.utime(str(path), (st.st_atime, st.st_mtime + 10))
+
+
+def test_debounce_and_verify(tmp_path):
+    bus = ProcessBus()
+    messages = []
+    bus.subscribe('log', lambda msg, level: messages.append(msg))
+    restarts = []
+    bus.restart = lambda: restarts.append(1)
+    reloader = tasks.Autoreloader(bus, backend='stat', match='^$')
+    reloader.max_backoff = 1
+    reloader.debounce = 0.2
+    reloader.verify = True
+    files = [tmp_path / ('f%d.py' % i) for i in range(3)]
+    for f in files:
+        f.write_text('x = 1')
+        reloader.files.add(str(f))
+    reloader.run()
+
+    # Same contents: no restart.
+    _touch(files[0], 'x = 1')
+    reloader.run()
+    time.sleep(0.25)
+    reloader.run()
+    assert restarts == []
+    assert 'Ignoring 1 changed file(s) with unchanged contents.' in messages
+
+    # A burst of changes makes one restart, once it has settled.
+    _touch(files[0], 'x = 2')
+    reloader.run()
+    _touch(files[1], 'x = 2')
+    reloader.run()
+    assert restarts == []
+    time.sleep(0.25)
+    reloader.run()
+    assert restarts == [1]
+    assert messages[-1] == 'Restarting because %s, %s changed.' % (
+        files[0], files[1])
+
+
+@pytest.fixture
+def hot_modules(tmp_path):
+    """Make importable modules hotreload_a and hotreload_b (which uses a)."""
+    (tmp_path / 'hotreload_a.py').write_text('x = 1\n')
+    (tmp_path / 'hotreload_b.py').write_text(
+        'import hotreload_a\n\ndef y():\n    return hotreload_a.x * 2\n'
+        'z = hotreload_a.x\n')
+    (tmp_path / 'hotreload_c.py').write_text('w = 1\n')
+    sys.path.insert(0, str(tmp_path))
+    try:
+        import hotreload_a  # noqa: F401
+        import hotreload_b  # noqa: F401
+        import hotreload_c  # noqa: F401
+        yield tmp_path
+    finally:
+        sys.path.remove(str(tmp_path))
+        for name in ('hotreload_a', 'hotreload_b', 'hotreload_c'):
+            sys.modules.pop(name, None)
+
+
+def test_reload_mode(hot_modules):
+    bus = ProcessBus()
+    restarts = []
+    bus.restart = lambda: restarts.append(1)
+    published = []
+    bus.subscribe('reload', lambda names: published.append(
+        (bus.state, list(names))))
+    states = []
+    bus.subscribe('START', lambda: states.append('START'))
+    reloader = tasks.Autoreloader(bus, backend='stat', match='^hotreload_',
+                                  mode='reload')
+    reloader.max_backoff = 1
+    reloader.debounce = 0
+    bus.transition('RUN')
+    reloader.run()
+
+    import hotreload_b
+    assert reloader.reload_order(['hotreload_a']) == [
+        'hotreload_a', 'hotreload_b']
+    _touch(hot_modules / 'hotreload_a.py', 'x = 2\n')
+    reloader.run()
+    assert restarts == []
+    assert published == [('IDLE', ['hotreload_a', 'hotreload_b'])]
+    assert states == ['START', 'START']
+    assert bus.state == 'RUN'
+    assert hotreload_b.y() == 4
+    assert hotreload_b.z == 2
+
+    # A broken module falls back to restarting.
+    _touch(hot_modules / 'hotreload_c.py', 'w = \n')
+    reloader.run()
+    assert restarts == [1]
+    bus.transition('EXITED')
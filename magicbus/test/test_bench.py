@@ -0,0 +1,34 @@
+import json
+
+from magicbus import bench
+
+
+def test_registered():
+    for name in ('publish[0]', 'publish_failing[10]', 'subscribe_churn',
+                 'graph_from_edges[16]', 'transition[4]', 'wait_wakeup[10]',
+                 'processbus_init', 'import_magicbus', 'publish_stats[10]',
+                 'stats_record'):
+        assert name in bench.benchmarks
+
+
+def test_json_and_baseline(tmp_path, capsys):
+    out = str(tmp_path / 'results.json')
+    args = ['-k', 'transition[1]', '--min-time', '0.001', '--repeat', '2']
+    assert bench.main(args + ['--json', '-o', out]) == 0
+    with open(out) as f:
+        results = json.load(f)['results']
+    assert list(results) == ['transition[1]']
+    assert results['transition[1]']['median'] > 0
+
+    # A baseline much slower than now is not a regression...
+    slow = str(tmp_path / 'slow.json')
+    with open(slow, 'w') as f:
+        json.dump({'results': {'transition[1]': {'median': 1.0}}}, f)
+    assert bench.main(args + ['--baseline', slow]) == 0
+
+    # ...but one much faster is.
+    fast = str(tmp_path / 'fast.json')
+    with open(fast, 'w') as f:
+        json.dump({'results': {'transition[1]': {'median': 1e-12}}}, f)
+    assert bench.main(args + ['--baseline', fast]) == 1
+    assert 'REGRESSION' in capsys.readouterr().err
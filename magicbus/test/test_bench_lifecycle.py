@@ -0,0 +1,24 @@
+import os
+
+import pytest
+
+from magicbus.test import bench_lifecycle
+
+
+def test_summarize():
+    s = bench_lifecycle.summarize([3, 1, 2, 4])
+    assert s['count'] == 4
+    assert s['min'] == 1
+    assert s['max'] == 4
+    assert s['p50'] == 2
+    assert s['p99'] == 4
+    assert s['mean'] == 2.5
+
+
+@pytest.mark.skipif(os.name != 'posix', reason='only supported on POSIX')
+def test_run():
+    results = bench_lifecycle.run(iterations=1, timeout=20)
+    assert sorted(results) == sorted(bench_lifecycle.phases)
+    for phase in bench_lifecycle.phases:
+        assert results[phase]['count'] == 1
+        assert results[phase]['min'] > 0
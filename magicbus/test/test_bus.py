@@ -1,4 +1,8 @@
-from magicbus.base import Graph
+import pickle
+
+import pytest
+
+from magicbus.base import Graph, TopicTrie
 
 
 #                                                       EXIT_ERROR
@@ -69,3 +73,68 @@ def test_shortest_path():
 def test_states():
     g = Graph(NEXT)
     assert g.states == STATES
+
+
+def test_graphs_are_shared():
+    g = Graph.from_edges(TRANSITIONS)
+    assert Graph.from_edges(dict(TRANSITIONS)) is g
+    assert Graph.from_edges({'A': 'B'}) is not g
+
+
+def test_long_chain():
+    # A ring of 40 states, each with a shortcut two states ahead.
+    size = 40
+    edges = dict(
+        (i, ((i + 1) % size, (i + 2) % size)) for i in range(size)
+    )
+    g = Graph.from_edges(edges)
+    assert len(g) == size * (size - 1)
+    assert g.states == set(range(size))
+
+    # Follow the path from 0 to 39: 19 hops of two, then one of one.
+    path = [0]
+    while path[-1] != size - 1:
+        path.append(g[(path[-1], size - 1)])
+    assert len(path) == 21
+
+
+def test_path():
+    g = Graph.from_edges(TRANSITIONS)
+    assert g.path('RUN', 'EXITED') == ('STOP', 'IDLE', 'EXIT', 'EXITED')
+    assert g.path('RUN', 'RUN') == ()
+    assert g.path('EXITED', 'RUN') == ()
+    assert g.path('NOWHERE', 'RUN') == ()
+    assert g.path('RUN', 'EXITED') is g.path('RUN', 'EXITED')
+
+
+def test_read_only():
+    g = Graph(NEXT)
+    with pytest.raises(TypeError):
+        g[('RUN', 'RUN')] = 'RUN'
+    with pytest.raises(TypeError):
+        g.update(NEXT)
+    assert pickle.loads(pickle.dumps(g)) == g
+
+
+def test_topic_trie():
+    t = TopicTrie()
+    for pattern in ('a.*', 'a.#', 'a.*.c', '#', 'b.*'):
+        t.add(pattern)
+    assert len(t) == 5
+    assert t.match('a') == {'a.#', '#'}
+    assert t.match('a.b') == {'a.*', 'a.#', '#'}
+    assert t.match('a.b.c') == {'a.*.c', 'a.#', '#'}
+    assert t.match('b') == {'#'}
+
+    t.discard('#')
+    t.discard('a.*.c')
+    t.discard('missing.*')
+    assert t.match('a.b.c') == {'a.#'}
+    assert t.match('b') == set()
+    assert set(t.root.children) == {'a', 'b'}
+
+    assert TopicTrie.is_pattern('cache.*')
+    assert TopicTrie.is_pattern('#')
+    assert not TopicTrie.is_pattern('cache.users')
+    assert not TopicTrie.is_pattern('a*b')
+    assert not TopicTrie.is_pattern(('*',))
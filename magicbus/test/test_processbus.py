@@ -1,13 +1,20 @@
 from __future__ import print_function
 
 import functools
+import gc
+import os
+import signal
+import subprocess
 import sys
 import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 
 import pytest
 
-from magicbus.base import Bus, ChannelFailures
+from magicbus.base import Bus, BusHook, ChannelFailures, Graph
+from magicbus.plugins import SimplePlugin
+from magicbus import process
 from magicbus.process import ProcessBus
 
 
@@ -88,6 +95,265 @@ class TestPublishSubscribe:
 
         assert self.responses == expected
 
+    def test_dispatch_tracks_subscriptions(self):
+        b = Bus()
+
+        self.responses = []
+        first = self.get_listener('hugh', 1)
+        second = self.get_listener('hugh', 2)
+        b.subscribe('hugh', first, priority=60)
+        b.publish('hugh')
+        b.subscribe('hugh', second, priority=40)
+        b.publish('hugh')
+        b.unsubscribe('hugh', first)
+        b.publish('hugh')
+        b.clear()
+        assert b.publish('hugh') == []
+
+        assert self.responses == [
+            msg % (1, 'hugh', ()),
+            msg % (2, 'hugh', ()),
+            msg % (1, 'hugh', ()),
+            msg % (2, 'hugh', ()),
+        ]
+
+    def test_channel_failures_collected(self):
+        b = Bus()
+
+        self.responses = []
+        b.subscribe('hugh', lambda: 1 / 0, priority=10)
+        b.subscribe('hugh', self.get_listener('hugh', 1), priority=20)
+        b.subscribe('hugh', lambda: {}['missing'], priority=30)
+
+        with pytest.raises(ChannelFailures) as exc_info:
+            b.publish('hugh')
+
+        assert self.responses == [msg % (1, 'hugh', ())]
+        assert [type(e) for e in exc_info.value.get_instances()] == [
+            ZeroDivisionError, KeyError,
+        ]
+
+    def test_wildcard_channels(self):
+        b = Bus()
+
+        self.responses = []
+        b.subscribe('cache.invalidate.*', self.get_listener('*', 1),
+                    priority=60)
+        b.subscribe('cache.#', self.get_listener('#', 2), priority=40)
+        b.subscribe('cache.invalidate.users', self.get_listener('users', 3))
+
+        b.publish('cache.invalidate.users')
+        b.publish('cache.invalidate.groups', 'g')
+        b.publish('cache')
+        b.publish('other')
+        assert self.responses == [
+            msg % (2, '#', ()),
+            msg % (3, 'users', ()),
+            msg % (1, '*', ()),
+            msg % (2, '#', ('g',)),
+            msg % (1, '*', ('g',)),
+            msg % (2, '#', ()),
+        ]
+        # Unknown channels are not cached.
+        assert 'other' not in b._dispatch
+
+        self.responses = []
+        b.unsubscribe('cache.#', b._dispatch['cache'][0])
+        b.publish('cache.invalidate.users')
+        assert self.responses == [
+            msg % (3, 'users', ()),
+            msg % (1, '*', ()),
+        ]
+
+    def test_wildcard_cache_is_bounded(self):
+        b = Bus()
+        b.max_matched_channels = 100
+        seen = []
+        b.subscribe('cache.invalidate.*', seen.append)
+        b.subscribe('cache.invalidate.users', lambda *a: None)
+
+        for n in range(5000):
+            b.publish('cache.invalidate.k%d' % n, n)
+        assert seen == list(range(5000))
+        # The 100 latest, the pattern itself and the concrete channel.
+        assert len(b._dispatch) <= 102
+        assert len(b._bands) <= 102
+        assert 'cache.invalidate.k4999' in b._dispatch
+        assert 'cache.invalidate.k0' not in b._dispatch
+
+        # Evicted channels are simply compiled again.
+        b.publish('cache.invalidate.k0', 'again')
+        assert seen[-1] == 'again'
+        b.publish('cache.invalidate.users', 'users')
+        assert seen[-1] == 'users'
+        assert 'cache.invalidate.users' in b._dispatch
+
+    def test_wildcards_with_other_channels(self):
+        # States need not be strings, and wait() publishes to no channel
+        # by default; neither can match a pattern.
+        b = Bus({1: 2, 2: 1}, initial_state=1)
+        b.subscribe('cache.*', lambda: None)
+        entered = []
+        b.subscribe(2, lambda: entered.append(2))
+
+        threading.Timer(0.05, b.transition, args=(2,)).start()
+        assert b.wait(2, interval=0.01, timeout=5) == 2
+        assert entered == [2]
+        assert b.publish(None) == []
+
+    def test_weak_subscriptions(self):
+        b = Bus()
+
+        class Plugin(SimplePlugin):
+            weak = True
+
+            def __init__(self, bus, responses):
+                SimplePlugin.__init__(self, bus)
+                self.responses = responses
+
+            def hugh(self, value):
+                self.responses.append(value)
+
+        b.listeners['hugh'] = set()
+        self.responses = []
+        plugin = Plugin(b, self.responses)
+        plugin.subscribe()
+        b.subscribe('hugh', self.get_listener('hugh', 1), weak=True)
+
+        b.publish('hugh', 'a')
+        assert self.responses == ['a']
+        assert b.reaped == 1
+
+        del plugin
+        gc.collect()
+        assert b.publish('hugh', 'b') == []
+        assert b.reaped == 2
+        assert b.listeners['hugh'] == set()
+        assert b._priorities == {}
+
+        # The callee itself may be used to unsubscribe.
+        plugin = Plugin(b, self.responses)
+        plugin.subscribe()
+        plugin.unsubscribe()
+        assert b.publish('hugh', 'c') == []
+        assert b.reaped == 2
+
+    def test_reap_during_compile(self):
+        b = Bus()
+        b.listeners['hugh'] = set()
+        victims = [lambda: 1, lambda: 2]
+        for victim in victims:
+            b.subscribe('hugh', victim, weak=True)
+        del victim
+
+        class Collecting(dict):
+            """Collect the listeners while compiling, as the GC might."""
+
+            def __getitem__(self, key):
+                del victims[:]
+                gc.collect()
+                return dict.__getitem__(self, key)
+
+        b._priorities = Collecting(b._priorities)
+        b._dispatch.clear()
+        # The collected listeners are only queued for reaping...
+        assert b.publish('hugh') == [None, None]
+        assert b.reaped == 0
+        b._priorities = dict(b._priorities)
+        # ...and unsubscribed by the next publish.
+        assert b.publish('hugh') == []
+        assert b.reaped == 2
+        assert b.listeners['hugh'] == set()
+        assert b._priorities == {}
+
+    def test_hooks(self):
+        b = ProcessBus()
+        events = []
+
+        class Recorder(BusHook):
+
+            def before_publish(self, channel, listener):
+                events.append(('before_publish', channel, listener))
+
+            def after_publish(self, channel, listener, duration, exc):
+                assert duration >= 0
+                events.append(('after_publish', channel, listener,
+                               type(exc)))
+
+            def before_transition(self, state, newstate):
+                events.append(('before_transition', state, newstate))
+
+            def after_transition(self, state, newstate, duration, exc):
+                events.append(('after_transition', state, newstate,
+                               type(exc)))
+
+        def fail():
+            raise ValueError()
+
+        recorder = Recorder()
+        b.add_hook(recorder)
+        b.subscribe('hugh', fail)
+        with pytest.raises(ChannelFailures):
+            b.publish('hugh')
+        assert events == [
+            ('before_publish', 'hugh', fail),
+            ('after_publish', 'hugh', fail, ValueError),
+        ]
+
+        del events[:]
+        b.subscribe('START', fail)
+        try:
+            b.transition('RUN')
+            transitions = [e[1:] for e in events
+                           if e[0] == 'after_transition']
+            # START failed, so the bus exits via START_ERROR.
+            assert transitions[:4] == [
+                ('INITIAL', 'ENTER', type(None)),
+                ('ENTER', 'IDLE', type(None)),
+                ('IDLE', 'START', ChannelFailures),
+                ('START_ERROR', 'STOP', type(None)),
+            ]
+            assert b.state == 'EXITED'
+        finally:
+            b.remove_hook(recorder)
+            b.transition('EXITED')
+        assert not b._intercepted
+
+    def test_concurrent_bands(self):
+        b = Bus()
+        b.executor = ThreadPoolExecutor(max_workers=4)
+        events = []
+
+        def get_sleeper(name):
+            def sleeper():
+                events.append(('start', name))
+                time.sleep(0.3)
+                events.append(('end', name))
+                return name
+            return sleeper
+
+        try:
+            for name in ('a', 'b', 'c'):
+                b.subscribe('hugh', get_sleeper(name), priority=10)
+            b.subscribe('hugh', lambda: 1 / 0, priority=10)
+            b.subscribe('hugh', get_sleeper('d'), priority=20)
+            # Nested publishing from a band runs serially.
+            b.subscribe('hugh', lambda: b.publish('louis'), priority=30)
+            b.subscribe('louis', lambda: 'nested', priority=10)
+            b.subscribe('louis', lambda: 'again', priority=10)
+
+            started = time.monotonic()
+            with pytest.raises(ChannelFailures) as exc_info:
+                b.publish('hugh')
+            elapsed = time.monotonic() - started
+        finally:
+            b.executor.shutdown()
+
+        # The first band runs at once, then the second one alone.
+        assert elapsed < 0.9
+        assert events[-2:] == [('start', 'd'), ('end', 'd')]
+        assert len(exc_info.value.get_instances()) == 1
+
 
 class TestBusMethod:
 
@@ -203,6 +469,28 @@ class TestBusMethod:
             'Bus state: EXITED'
         ])
 
+    def test_exit_with_executor(self):
+        b = ProcessBus()
+        b.executor = ThreadPoolExecutor(max_workers=4)
+        started = []
+        b.subscribe('START', lambda: started.append(1), priority=10)
+        b.subscribe('START', lambda: started.append(2), priority=10)
+
+        try:
+            b.transition('RUN')
+            assert sorted(started) == [1, 2]
+            assert b._executor_threads
+
+            # ThreadWait MUST NOT wait for the idle executor threads.
+            t = threading.Thread(target=b.transition, args=('EXITED',))
+            t.daemon = True
+            t.start()
+            t.join(10)
+            assert not t.is_alive()
+            assert b.state == 'EXITED'
+        finally:
+            b.executor.shutdown()
+
     def test_wait(self):
         b = ProcessBus()
         self.log(b)
@@ -252,6 +540,46 @@ class TestBusMethod:
             for t in threading.enumerate()
         ), 'Post condition failed: some test threads are still alive'
 
+    def test_wait_timeout(self):
+        b = ProcessBus()
+        self.log(b)
+
+        ticks = []
+        b.subscribe('tick', lambda: ticks.append(1))
+
+        started = time.monotonic()
+        assert b.wait('RUN', interval=0.05, channel='tick', timeout=0.3) is None
+        assert 0.3 <= time.monotonic() - started < 1
+        assert len(ticks) > 1
+        assert b.wait(['INITIAL', 'RUN'], timeout=0) == 'INITIAL'
+        b.transition('EXITED')
+
+    def test_wait_many_threads(self):
+        b = ProcessBus()
+        self.log(b)
+
+        results = []
+        waiters = [
+            threading.Thread(
+                target=lambda: results.append(b.wait(['RUN', 'EXITED'])),
+            )
+            for _ in range(50)
+        ]
+        for t in waiters:
+            t.start()
+        # Entering other states wakes none of the waiters.
+        b.transition('IDLE')
+        assert results == []
+
+        b.transition('RUN')
+        for t in waiters:
+            t.join(timeout=5)
+        try:
+            assert results == ['RUN'] * 50
+            assert not b._state_waiters
+        finally:
+            b.transition('EXITED')
+
     def test_block(self):
         b = ProcessBus()
         self.log(b)
@@ -313,6 +641,30 @@ class TestBusMethod:
         # to the "main" channel.
         assert len(main_calls) > 0
 
+    @pytest.mark.skipif(os.name != 'posix', reason='requires POSIX signals')
+    def test_transition_from_signal_handler(self):
+        b = ProcessBus()
+        self.log(b)
+
+        # Signals interrupt the main thread wherever it is in wait(),
+        # including while it holds the lock which guards the state.
+        states = ['RUN', 'IDLE'] * 25 + ['EXITED']
+
+        def handler(signum, frame):
+            if states:
+                b.transition(states.pop(0))
+        old = signal.signal(signal.SIGALRM, handler)
+        signal.setitimer(signal.ITIMER_REAL, 0.002, 0.002)
+        try:
+            while len(states) > 1:
+                b.wait(['EXITED', 'INITIAL'], interval=0.001, timeout=0)
+            b.block(interval=0.01)
+        finally:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, old)
+        assert b.state == 'EXITED'
+        assert states == []
+
     @pytest.mark.xfail(
         reason='Fails intermittently; https://tinyurl.com/ybwwu4gz',
         raises=AssertionError,
@@ -366,3 +718,21 @@ class TestBusMethod:
             )
         else:
             pytest.fail('NameError was not raised as expected.')
+
+
+def test_precomputed_transitions():
+    assert process.transitions == Graph.from_edges(process.edges)
+    assert ProcessBus().transitions is process.transitions
+
+
+def test_lazy_import():
+    code = (
+        'import sys, magicbus\n'
+        'lazy = ("asyncio", "magicbus.process", "magicbus.plugins")\n'
+        'assert not [m for m in lazy if m in sys.modules], sys.modules\n'
+        'from magicbus import bus\n'
+        'assert bus is magicbus.bus\n'
+        'assert isinstance(bus, magicbus.ProcessBus)\n'
+        'assert bus.state == "INITIAL"\n'
+    )
+    subprocess.check_call([sys.executable, '-c', code])
@@ -0,0 +1,82 @@
+import time
+
+from magicbus.base import Bus
+from magicbus.stats import Histogram, ListenerStats
+
+
+def test_histogram_buckets():
+    for value in list(range(1000)) + [10 ** 6, 10 ** 9, 3 * 10 ** 9]:
+        low, high = Histogram.bucket_bounds(Histogram.bucket(value))
+        assert low <= value <= high
+        assert high - low <= low // 4
+
+
+def test_histogram_percentiles():
+    h = Histogram()
+    for value in range(1, 1001):
+        h.record(value * 1000)
+
+    s = h.summary()
+    assert s['count'] == 1000
+    assert s['max'] == 1000000
+    assert s['mean'] == 500500
+    assert 500000 <= s['p50'] <= 500000 * 1.25
+    assert 950000 <= s['p95'] <= 1000000
+    assert 990000 <= s['p99'] <= 1000000
+
+
+def test_listener_stats_record_matches_histogram():
+    # ListenerStats.record inlines Histogram.record; they must agree.
+    stats = ListenerStats()
+    wall, cpu = Histogram(), Histogram()
+    for value in list(range(100)) + [999, 10 ** 6, 10 ** 9, 2 ** 50]:
+        stats.record('hugh', None, value, value * 3)
+        wall.record(value)
+        cpu.record(value * 3)
+
+    recorded = stats.histograms[('hugh', None)]
+    for actual, expected in zip(recorded, (wall, cpu)):
+        assert actual.counts == expected.counts
+        assert actual.summary() == expected.summary()
+
+
+def test_listener_stats():
+    b = Bus()
+    assert b.stats() == {}
+
+    def slow():
+        time.sleep(0.02)
+
+    def fast():
+        pass
+
+    def broken():
+        raise ValueError()
+
+    log = []
+    b.subscribe('log', lambda msg, level: log.append(msg))
+    b.subscribe('hugh', slow)
+    b.subscribe('hugh', fast)
+    b.subscribe('louis', broken)
+    b.listener_stats = ListenerStats()
+
+    for _ in range(5):
+        b.publish('hugh')
+    try:
+        b.publish('louis')
+    except Exception:
+        pass
+
+    stats = b.stats()
+    assert stats[('hugh', slow)]['wall']['count'] == 5
+    assert stats[('hugh', slow)]['wall']['p50'] >= 20000000
+    assert stats[('hugh', slow)]['cpu']['p50'] < 20000000
+    assert stats[('hugh', fast)]['wall']['p99'] < 20000000
+    assert stats[('louis', broken)]['wall']['count'] == 1
+
+    del log[:]
+    b.log_stats()
+    lines = log[-1].splitlines()
+    assert lines[0] == 'Listener timings:'
+    # Slowest first.
+    assert lines[1].startswith('hugh ') and 'slow' in lines[1]
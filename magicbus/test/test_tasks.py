@@ -1,3 +1,8 @@
+import threading
+import time
+
+import pytest
+
 from magicbus.plugins import tasks
 from magicbus.test import WebAdapter, WebService, WebHandler
 
@@ -42,3 +47,452 @@ def test_thread_manager():
         assert len(tm.threads) == 0
     finally:
         bus.transition('EXITED')
+
+
+def test_dispatcher():
+    bus = ProcessBus()
+    dispatcher = tasks.Dispatcher(bus, maxsize=2, overflow='drop_oldest')
+    dispatcher.subscribe()
+
+    received = []
+    publisher = threading.current_thread()
+
+    def listener(n):
+        assert threading.current_thread() is not publisher
+        received.append(n)
+    bus.subscribe('tick', listener)
+
+    try:
+        # Before START, events queue up to maxsize.
+        for n in range(4):
+            assert bus.post('tick', n)
+        assert len(dispatcher) == 2
+        assert dispatcher.dropped == 2
+
+        bus.transition('RUN')
+        for n in range(4, 8):
+            bus.post('tick', n)
+        # STOP drains the queue before stopping the thread.
+        bus.transition('IDLE')
+        assert received[:2] == [2, 3]
+        assert sorted(received) == received
+        assert dispatcher.queued == 8
+        assert dispatcher.dispatched == len(received)
+        assert dispatcher.dropped == 8 - len(received)
+        assert not dispatcher.running
+        assert dispatcher.shards[0].thread is None
+    finally:
+        bus.transition('EXITED')
+
+
+def test_dispatcher_drop_newest():
+    bus = ProcessBus()
+    dispatcher = tasks.Dispatcher(bus, maxsize=1, overflow='drop_newest')
+    dispatcher.subscribe()
+    received = []
+    bus.subscribe('tick', received.append)
+
+    try:
+        assert bus.post('tick', 1)
+        assert not bus.post('tick', 2)
+        bus.transition('RUN')
+        bus.transition('IDLE')
+        assert received == [1]
+    finally:
+        bus.transition('EXITED')
+
+    dispatcher.unsubscribe()
+    assert bus.dispatcher is None
+    bus.post('tick', 3)
+    assert received == [1, 3]
+
+
+def test_dispatcher_overflow_policy():
+    with pytest.raises(ValueError):
+        tasks.Dispatcher(ProcessBus(), overflow='explode')
+
+
+def test_sharded_dispatcher():
+    bus = ProcessBus()
+    dispatcher = tasks.Dispatcher(bus, shards=4)
+    dispatcher.subscribe()
+
+    received = {}
+    threads = {}
+
+    def listener(key, n):
+        received.setdefault(key, []).append(n)
+        threads.setdefault(key, set()).add(threading.current_thread().name)
+    bus.subscribe('tick', listener)
+
+    bus.transition('RUN')
+    try:
+        for n in range(200):
+            key = n % 7
+            assert bus.post_keyed(key, 'tick', key, n)
+        assert len(dispatcher.depths) == 4
+        bus.transition('IDLE')
+
+        assert dispatcher.depths == [0, 0, 0, 0]
+        assert dispatcher.dispatched == 200
+        for key, ns in received.items():
+            # Each key is published in order, by a single shard.
+            assert ns == list(range(key, 200, 7))
+            assert len(threads[key]) == 1
+        assert len(set().union(*threads.values())) > 1
+    finally:
+        bus.transition('EXITED')
+
+
+def test_sharded_dispatcher_cross_posting():
+    bus = ProcessBus()
+    dispatcher = tasks.Dispatcher(bus, maxsize=1, shards=2)
+    dispatcher.subscribe()
+
+    both = threading.Barrier(2, timeout=5)
+    done = []
+
+    def flood(key):
+        # Each shard fills the other's queue while its own is busy.
+        both.wait()
+        for n in range(5):
+            bus.post_keyed(key, 'noop')
+        done.append(key)
+    bus.subscribe('flood', flood)
+
+    bus.transition('RUN')
+    try:
+        # Keys 0 and 1 go to shards 0 and 1.
+        assert bus.post_keyed(0, 'flood', 1)
+        assert bus.post_keyed(1, 'flood', 0)
+        deadline = time.monotonic() + 5
+        while len(done) < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert sorted(done) == [0, 1]
+        assert dispatcher.dropped
+    finally:
+        bus.transition('EXITED')
+
+
+@pytest.mark.parametrize('cls', [tasks.BackgroundTask, tasks.PerpetualTimer])
+def test_timer_cancel_is_immediate(cls):
+    calls = []
+    task = cls(60, calls.append, args=[1])
+    task.start()
+    time.sleep(0.05)
+    started = time.monotonic()
+    task.cancel()
+    task.join(5)
+    assert not task.is_alive()
+    assert time.monotonic() - started < 0.5
+    assert calls == []
+
+
+@pytest.mark.parametrize('cls', [tasks.BackgroundTask, tasks.PerpetualTimer])
+def test_timer_fixed_rate(cls):
+    times = []
+
+    def work():
+        times.append(time.monotonic())
+        time.sleep(0.05)
+
+    task = cls(0.1, work)
+    task.start()
+    time.sleep(0.75)
+    task.cancel()
+    task.join(5)
+    assert len(times) >= 5
+    # Runs start at whole intervals rather than interval + run time apart.
+    gaps = [b - a for a, b in zip(times, times[1:])]
+    assert 0.08 < sum(gaps) / len(gaps) < 0.12
+
+
+def test_next_run_skips_missed_runs():
+    now = time.monotonic()
+    assert tasks._next_run(now - 0.35, 0.1) > now
+    assert tasks._next_run(now - 0.35, 0.1) < now + 0.1
+    assert tasks._next_run(now + 1, 0.1) == pytest.approx(now + 1.1)
+
+
+def test_scheduler():
+    bus = ProcessBus()
+    scheduler = tasks.Scheduler(bus, workers=2, jitter=0)
+    scheduler.subscribe()
+    counts = [0] * 20
+
+    def tick(i):
+        counts[i] += 1
+
+    jobs = [scheduler.schedule(tick, 0.05, args=(i,)) for i in range(20)]
+    monitor_calls = []
+    monitor = tasks.Monitor(bus, lambda: monitor_calls.append(1),
+                            frequency=0.05, scheduler=scheduler)
+    monitor.subscribe()
+
+    threads = threading.active_count()
+    bus.transition('RUN')
+    assert monitor.thread is None
+    assert monitor.job is not None
+    time.sleep(0.3)
+    # One timer thread plus the workers.
+    assert threading.active_count() <= threads + 3
+    assert all(c >= 3 for c in counts)
+    assert len(monitor_calls) >= 3
+
+    jobs[0].cancel()
+    # Let any run which was already handed to a worker finish.
+    time.sleep(0.02)
+    cancelled = counts[0]
+    time.sleep(0.15)
+    assert counts[0] == cancelled
+    assert len(scheduler) == 20
+
+    bus.transition('EXITED')
+    assert monitor.job is None
+    assert len(scheduler) == 19
+    assert scheduler.pool is None
+    assert not scheduler.running
+
+
+def test_scheduler_overrun():
+    bus = ProcessBus()
+    messages = []
+    bus.subscribe('log', lambda msg, level: messages.append(msg))
+    scheduler = tasks.Scheduler(bus, jitter=0)
+    scheduler.subscribe()
+    job = scheduler.schedule(time.sleep, 0.05, args=(0.12,), name='slow')
+
+    bus.transition('RUN')
+    time.sleep(0.4)
+    bus.transition('EXITED')
+    assert job.runs >= 2
+    assert job.overruns == job.runs
+    assert job.skipped >= 1
+    assert job.last_duration >= 0.12
+    assert any("job 'slow' overran" in m for m in messages)
+
+
+def test_scheduler_log_listener_schedules():
+    bus = ProcessBus()
+    scheduler = tasks.Scheduler(bus, jitter=0)
+    scheduler.subscribe()
+    scheduled = []
+
+    def log(msg, level):
+        if msg.startswith('Skipped a run'):
+            scheduled.append(scheduler.schedule(lambda: None, 60))
+    bus.subscribe('log', log)
+    scheduler.schedule(time.sleep, 0.02, args=(0.1,), name='slow')
+
+    bus.transition('RUN')
+    time.sleep(0.3)
+    bus.transition('EXITED')
+    assert scheduled
+
+
+def test_scheduler_job_stops_bus():
+    bus = ProcessBus()
+    scheduler = tasks.Scheduler(bus)
+    scheduler.subscribe()
+    scheduler.schedule(bus.transition, 0.01, args=('EXITED',))
+    bus.transition('RUN')
+    assert bus.wait('EXITED', timeout=5) == 'EXITED'
+
+
+def test_thread_manager_slots():
+    bus = ProcessBus()
+    tm = tasks.ThreadManager(bus)
+    tm.subscribe()
+    started, stopped = [], []
+    bus.subscribe('start_thread', started.append)
+    bus.subscribe('stop_thread', stopped.append)
+
+    barrier = threading.Barrier(20)
+    release = threading.Event()
+    indexes = {}
+
+    def worker(n):
+        barrier.wait()
+        bus.publish('acquire_thread')
+        bus.publish('acquire_thread')
+        indexes[n] = tm.index()
+        release.wait()
+        if n % 2:
+            bus.publish('release_thread')
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(20)]
+    for t in threads:
+        t.start()
+    while len(indexes) < 20:
+        time.sleep(0.01)
+    # Each thread got a distinct index, and only one start_thread.
+    assert sorted(indexes.values()) == list(range(1, 21))
+    assert sorted(started) == list(range(1, 21))
+    assert tm.size == 20
+    assert tm.index() is None
+
+    release.set()
+    for t in threads:
+        t.join()
+    freed = sorted(indexes[n] for n in range(1, 20, 2))
+    assert sorted(stopped) == freed
+
+    # Released indexes are reused, lowest first.
+    bus.publish('acquire_thread')
+    assert tm.index() == freed[0]
+    assert tm.size == 20
+
+    bus.transition('RUN')
+    bus.transition('IDLE')
+    # The 10 threads which never released, and this one.
+    assert len(stopped) == 21
+    assert tm.size == 0
+    assert tm.index() is None
+    bus.publish('acquire_thread')
+    assert tm.index() == 1
+    bus.transition('EXITED')
+
+
+class Resource:
+
+    def __init__(self, healthy=True):
+        self.healthy = healthy
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def test_thread_resource_pool():
+    bus = ProcessBus()
+    tm = tasks.ThreadManager(bus)
+    tm.subscribe()
+    made = []
+
+    def factory():
+        made.append(Resource())
+        return made[-1]
+
+    pool = tasks.ThreadResourcePool(
+        bus, tm, factory, check=lambda r: r.healthy, maxsize=2)
+    pool.subscribe()
+
+    # Resources are made lazily, once per thread.
+    bus.publish('acquire_thread')
+    assert made == []
+    first = pool.get()
+    assert pool.get() is first
+    assert len(pool) == 1
+
+    got = []
+
+    hold = threading.Event()
+
+    def worker(release):
+        got.append(pool.get())
+        if release:
+            bus.publish('release_thread')
+        else:
+            hold.wait()
+
+    t = threading.Thread(target=worker, args=(True,))
+    t.start()
+    t.join()
+    assert got[0] is not first and got[0].closed
+    assert len(pool) == 1
+
+    # The cap counts live resources only.
+    held = threading.Thread(target=worker, args=(False,))
+    held.start()
+    while len(got) < 2:
+        time.sleep(0.01)
+    assert len(pool) == 2
+    errors = []
+
+    def over_cap():
+        try:
+            pool.get()
+        except RuntimeError as exc:
+            errors.append(exc)
+
+    t = threading.Thread(target=over_cap)
+    t.start()
+    t.join()
+    hold.set()
+    held.join()
+    assert len(errors) == 1
+    assert len(pool) == 2
+
+    # Resources used since the last check are skipped; idle ones
+    # which fail their check are closed and replaced.
+    got[1].healthy = False
+    pool.check_idle()
+    assert not got[1].closed
+    pool.check_idle()
+    assert got[1].closed and not first.closed
+    assert len(pool) == 1
+    assert pool.get() is first
+
+    bus.transition('RUN')
+    bus.transition('IDLE')
+    assert first.closed
+    assert len(pool) == 0
+    bus.transition('EXITED')
+
+
+def test_thread_resource_pool_without_thread_manager():
+    bus = ProcessBus()
+    tm = tasks.ThreadManager(bus)
+    pool = tasks.ThreadResourcePool(bus, tm, Resource)
+    pool.subscribe()
+    with pytest.raises(RuntimeError, match='ThreadManager'):
+        pool.get()
+    assert len(pool) == 0
+
+
+def test_thread_resource_pool_check_keeps_cap():
+    bus = ProcessBus()
+    tm = tasks.ThreadManager(bus)
+    tm.subscribe()
+    errors = []
+
+    def check(resource):
+        # The resource is out of its slot but still counts.
+        assert len(pool) == 1
+        try:
+            pool.get()
+        except RuntimeError as exc:
+            errors.append(exc)
+        return True
+
+    pool = tasks.ThreadResourcePool(bus, tm, Resource, check=check, maxsize=1)
+    pool.subscribe()
+    first = pool.get()
+    pool.check_idle()
+    pool.check_idle()
+    assert len(errors) == 1
+    assert len(pool) == 1
+    assert pool.get() is first and not first.closed
+    bus.transition('EXITED')
+
+
+def test_thread_resource_pool_stop_during_check():
+    bus = ProcessBus()
+    tm = tasks.ThreadManager(bus)
+    tm.subscribe()
+
+    def check(resource):
+        # STOP runs (on another thread, say) while this one is checked.
+        pool.STOP()
+        return True
+
+    pool = tasks.ThreadResourcePool(bus, tm, Resource, check=check)
+    pool.subscribe()
+    first = pool.get()
+    pool.check_idle()
+    pool.check_idle()
+    # It is closed rather than put back after STOP.
+    assert first.closed
+    assert len(pool) == 0
+    assert pool.resources == [None, None]
+    bus.transition('EXITED')
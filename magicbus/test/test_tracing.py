@@ -0,0 +1,80 @@
+import io
+import json
+import threading
+import time
+
+from magicbus.base import Bus, State
+from magicbus.plugins.tracing import Tracer
+from magicbus.process import ProcessBus
+
+
+def test_chrome_trace():
+    bus = ProcessBus()
+    tracer = Tracer(bus, capacity=1000)
+    tracer.subscribe()
+
+    def start():
+        time.sleep(0.01)
+    bus.subscribe('START', start)
+
+    def worker():
+        bus.publish('hugh')
+    bus.subscribe('hugh', lambda: None)
+    t = threading.Thread(target=worker, name='worker')
+    t.start()
+    t.join()
+
+    bus.transition('RUN')
+    bus.transition('EXITED')
+    tracer.unsubscribe()
+
+    f = io.StringIO()
+    tracer.dump(f)
+    trace = json.loads(f.getvalue())
+    events = trace['traceEvents']
+
+    names = dict((e['tid'], e['args']['name'])
+                 for e in events if e['ph'] == 'M')
+    assert 'worker' in names.values()
+
+    transitions = [e['name'] for e in events if e.get('cat') == 'transition']
+    assert 'IDLE -> START' in transitions
+    assert transitions[-1] == 'EXIT -> EXITED'
+
+    starts = [e for e in events
+              if e.get('cat') == 'listener' and e['args']['channel'] == 'START']
+    assert len(starts) == 1
+    assert starts[0]['name'].endswith('start')
+    assert starts[0]['dur'] >= 10000
+
+    logs = [e['name'] for e in events if e.get('cat') == 'log']
+    assert 'Bus state: RUN' in logs
+
+
+def test_ring_buffer():
+    bus = ProcessBus()
+    tracer = Tracer(bus, capacity=5)
+    tracer.subscribe()
+    for _ in range(20):
+        bus.log('hello')
+    assert len(tracer.events) == 5
+
+
+def test_state_objects():
+    a, b = State('A'), State('B')
+    bus = Bus({a: b}, initial_state=a)
+    tracer = Tracer(bus)
+    tracer.subscribe()
+    bus.subscribe(b, lambda: None)
+    bus.subscribe(42, lambda: None)
+    bus.transition(b)
+    bus.publish(42)
+
+    f = io.StringIO()
+    tracer.dump(f)
+    events = json.loads(f.getvalue())['traceEvents']
+    transitions = [e for e in events if e.get('cat') == 'transition']
+    assert transitions[-1]['args'] == {'from': repr(a), 'to': repr(b)}
+    channels = [e['args']['channel'] for e in events
+                if e.get('cat') == 'listener']
+    assert channels == [repr(b), '42']